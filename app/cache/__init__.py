@@ -0,0 +1,3 @@
+"""
+Caching layer
+"""
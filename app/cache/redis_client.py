@@ -0,0 +1,135 @@
+"""
+Optional Redis cache
+Caching is disabled when REDIS_URL is unset, and any Redis error is treated
+as a cache miss so requests always fall back to the database.
+Configure the server with maxmemory-policy allkeys-lfu.
+"""
+
+from typing import Optional, Tuple
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from app.config import settings
+
+
+# Short timeouts so an unreachable Redis degrades to a miss instead of stalling requests
+redis_client: Optional[Redis] = Redis.from_url(
+    settings.REDIS_URL,
+    socket_connect_timeout=0.25,
+    socket_timeout=0.25,
+) if settings.REDIS_URL else None
+
+
+def transactions_key(user_id: int) -> str:
+    """Hash holding a user's cached transaction pages, one field per page"""
+    return f"txns:{user_id}"
+
+
+async def get_cached_transactions(user_id: int, page: str) -> Optional[bytes]:
+    """Get a cached transaction page, or None"""
+    if redis_client is None:
+        return None
+    try:
+        return await redis_client.hget(transactions_key(user_id), page)
+    except RedisError:
+        return None
+
+
+async def cache_transactions(user_id: int, page: str, body: bytes) -> None:
+    """Cache a transaction page; every page of a user expires together"""
+    if redis_client is None:
+        return
+    key = transactions_key(user_id)
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, page, body)
+            pipe.expire(key, settings.TRANSACTIONS_CACHE_TTL, nx=True)
+            await pipe.execute()
+    except RedisError:
+        pass
+
+
+async def invalidate_transactions(*user_ids: int) -> None:
+    """Drop all cached transaction pages for the given users"""
+    if redis_client is None:
+        return
+    try:
+        await redis_client.delete(*(transactions_key(user_id) for user_id in user_ids))
+    except RedisError:
+        pass
+
+
+def balance_key(user_id: int) -> str:
+    """String holding a user's cached "balance:wallet_number" """
+    return f"wallet:balance:{user_id}"
+
+
+async def get_cached_balance(user_id: int) -> Optional[Tuple[int, str]]:
+    """Get a cached (balance in kobo, wallet number), or None"""
+    if redis_client is None:
+        return None
+    try:
+        cached = await redis_client.get(balance_key(user_id))
+    except RedisError:
+        return None
+    if cached is None:
+        return None
+    balance, _, wallet_number = cached.decode().partition(":")
+    return int(balance), wallet_number
+
+
+async def cache_balance(user_id: int, balance: int, wallet_number: str) -> None:
+    """Cache a user's balance and wallet number"""
+    if redis_client is None:
+        return
+    try:
+        await redis_client.set(
+            balance_key(user_id), f"{balance}:{wallet_number}", ex=settings.BALANCE_REDIS_TTL
+        )
+    except RedisError:
+        pass
+
+
+async def invalidate_wallet_caches(*user_ids: int) -> None:
+    """Drop cached balances and transaction pages for the given users in one DEL"""
+    if redis_client is None:
+        return
+    keys = [balance_key(user_id) for user_id in user_ids]
+    keys += [transactions_key(user_id) for user_id in user_ids]
+    try:
+        await redis_client.delete(*keys)
+    except RedisError:
+        pass
+
+
+def settled_deposit_key(reference: str) -> str:
+    """String holding the amount of a successful deposit (success is final)"""
+    return f"tx:ref:{reference}"
+
+
+async def get_cached_settled_deposit(reference: str) -> Optional[int]:
+    """Get a successful deposit's cached amount in kobo, or None"""
+    if redis_client is None:
+        return None
+    try:
+        cached = await redis_client.get(settled_deposit_key(reference))
+    except RedisError:
+        return None
+    return int(cached) if cached is not None else None
+
+
+async def cache_settled_deposit(reference: str, amount: int) -> None:
+    """Cache a successful deposit's amount"""
+    if redis_client is None:
+        return
+    try:
+        await redis_client.set(
+            settled_deposit_key(reference), amount, ex=settings.DEPOSIT_CACHE_TTL
+        )
+    except RedisError:
+        pass
+
+
+async def close_redis() -> None:
+    """Close the Redis connection pool"""
+    if redis_client is not None:
+        await redis_client.aclose()
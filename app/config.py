@@ -24,6 +24,13 @@ class Settings:
     PAYSTACK_PUBLIC_KEY: str = os.getenv("PAYSTACK_PUBLIC_KEY", "")
     PAYSTACK_WEBHOOK_SECRET: str = os.getenv("PAYSTACK_WEBHOOK_SECRET", "")
     BASE_URL: str = os.getenv("BASE_URL", "http://localhost:8000")
+    MAX_WEBHOOK_PAYLOAD_BYTES: int = 64 * 1024
+    
+    # Redis (optional; caching is disabled when unset)
+    REDIS_URL: str = os.getenv("REDIS_URL", "")
+    TRANSACTIONS_CACHE_TTL: int = int(os.getenv("TRANSACTIONS_CACHE_TTL", "5"))  # seconds
+    BALANCE_REDIS_TTL: int = int(os.getenv("BALANCE_REDIS_TTL", "10"))  # seconds
+    DEPOSIT_CACHE_TTL: int = int(os.getenv("DEPOSIT_CACHE_TTL", "60"))  # seconds
     
     # API Key Settings
     API_KEY_PREFIX: str = "sk_live_"
@@ -32,6 +39,7 @@ class Settings:
     # Wallet Settings
     MIN_DEPOSIT_AMOUNT: int = 100  # Minimum deposit in kobo (1 Naira)
     MIN_TRANSFER_AMOUNT: int = 100  # Minimum transfer in kobo
+    BALANCE_CACHE_TTL: float = float(os.getenv("BALANCE_CACHE_TTL", "1"))  # seconds, per process
 
 
 settings = Settings()
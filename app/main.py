@@ -2,30 +2,57 @@
 Main FastAPI application for Wallet Service
 """
 
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
+from fastapi.openapi.utils import get_openapi
+from fastapi.routing import APIRoute
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import orjson
+from app.cache.redis_client import close_redis
 from app.config import settings
-from app.database import init_db
+from app.database import init_db, warm_up_pool, close_db
+from app.middleware.asgi_auth import CombinedMiddleware, PUBLIC_PATHS
 from app.routes import auth, keys, wallet
+from app.services.deposit_verifier import pending_verifier
+from app.services.auth_service import init_google_client, close_google_client
+from app.services.paystack_service import init_paystack_client, close_paystack_client
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize database and shared clients on startup and release them on shutdown"""
+    await init_db()
+    await warm_up_pool()
+    await init_paystack_client()
+    await init_google_client()
+    pending_verifier.start()
+    yield
+    await pending_verifier.stop()
+    await close_google_client()
+    await close_paystack_client()
+    await close_redis()
+    await close_db()
+
+
+def generate_operation_id(route: APIRoute) -> str:
+    """Generate short OpenAPI operation IDs (tag_function)"""
+    if route.tags:
+        return f"{route.tags[0].lower().replace(' ', '_')}_{route.name}"
+    return route.name
 
-# Initialize database
-init_db()
 
 # Create FastAPI app
 app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+    generate_unique_id_function=generate_operation_id,
     title="Wallet Service API",
     version="1.0.0",
     description="Wallet service with Paystack integration, JWT authentication, and API key management"
 )
 
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# CORS + auth middleware
+app.add_middleware(CombinedMiddleware, allow_origins=["*"])
 
 # Include routers
 app.include_router(auth.router)
@@ -33,12 +60,19 @@ app.include_router(keys.router)
 app.include_router(wallet.router)
 
 # Add security schemes to OpenAPI schema (must be after routers are included)
-def custom_openapi():
-    if app.openapi_schema:
-        return app.openapi_schema
-    
-    from fastapi.openapi.utils import get_openapi
-    
+
+_METHODS = frozenset({"post", "get", "put", "delete", "patch"})
+
+# Shared by every protected operation; the schema is built once and only serialized
+SECURITY_LIST = [
+    {"Bearer": []},
+    {"APIKey": []}
+]
+
+
+@lru_cache(maxsize=1)
+def _build_openapi():
+    """Build the OpenAPI schema once per process"""
     openapi_schema = get_openapi(
         title=app.title,
         version=app.version,
@@ -63,25 +97,37 @@ def custom_openapi():
     }
     
     # Add security to protected endpoints
-    public_paths = ["/", "/health", "/auth/google", "/auth/google/callback", "/wallet/paystack/webhook"]
-    
     for path, path_item in openapi_schema.get("paths", {}).items():
+        # Skip public endpoints (same set the auth middleware lets through)
+        if path in PUBLIC_PATHS:
+            continue
         for method, operation in path_item.items():
-            if method in ["post", "get", "put", "delete", "patch"]:
-                # Skip public endpoints
-                if path in public_paths:
-                    continue
-                # Add security requirements
-                if "security" not in operation:
-                    operation["security"] = [
-                        {"Bearer": []},
-                        {"APIKey": []}
-                    ]
+            if method in _METHODS and "security" not in operation:
+                operation["security"] = SECURITY_LIST
     
     app.openapi_schema = openapi_schema
     return app.openapi_schema
 
-app.openapi = custom_openapi
+app.openapi = _build_openapi
+
+
+@lru_cache(maxsize=1)
+def _openapi_json() -> bytes:
+    """Serialize the OpenAPI schema once per process"""
+    return orjson.dumps(app.openapi())
+
+
+# Replace FastAPI's default schema route with the pre-serialized one
+app.router.routes[:] = [
+    route for route in app.router.routes
+    if getattr(route, "path", None) != app.openapi_url
+]
+
+
+@app.get(app.openapi_url, include_in_schema=False)
+async def openapi_json():
+    """OpenAPI schema endpoint"""
+    return Response(content=_openapi_json(), media_type="application/json")
 
 
 @app.get("/")
@@ -0,0 +1,86 @@
+"""
+Batched API key lookups for the authentication middleware
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import Row, select
+from app.database import AsyncSessionLocal
+from app.models import APIKey, User
+
+
+class ApiKeyBatcher:
+    """
+    Collect API key lookups that arrive within a short window and resolve
+    them with a single SELECT ... WHERE key_hash IN (...)
+    """
+
+    def __init__(self, max_batch_size: int = 50, max_queue_time: float = 0.002):
+        self.max_batch_size = max_batch_size
+        self.max_queue_time = max_queue_time
+        self._pending: Dict[bytes, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def submit(self, key_hash: bytes) -> Optional[Row]:
+        """Queue a key hash and wait for its live key row, if any"""
+        future = self._pending.get(key_hash)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[key_hash] = future
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.max_queue_time, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        """Dispatch the queued keys as one batch"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[bytes, asyncio.Future]):
+        """Resolve a batch and fulfil its waiting lookups"""
+        try:
+            rows = await self.process_batch(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key_hash, future in batch.items():
+            if not future.done():
+                future.set_result(rows.get(key_hash))
+
+    async def process_batch(self, key_hashes: List[bytes]) -> Dict[bytes, Row]:
+        """Fetch live keys and their owners' emails for a batch of key hashes"""
+        async with AsyncSessionLocal() as db:
+            # Plain column rows; no mapped instances or identity map entries
+            result = await db.execute(
+                select(
+                    APIKey.key_hash,
+                    APIKey.user_id,
+                    APIKey.permissions,
+                    APIKey.expires_at,
+                    User.email,
+                ).join(
+                    User, APIKey.user_id == User.id
+                ).where(
+                    APIKey.key_hash.in_(key_hashes),
+                    APIKey.is_revoked == False,
+                    APIKey.expires_at > datetime.utcnow(),
+                )
+            )
+            return {row.key_hash: row for row in result}
+
+
+api_key_batcher = ApiKeyBatcher()
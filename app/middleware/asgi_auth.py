@@ -0,0 +1,187 @@
+"""
+Pure ASGI authentication middleware
+"""
+
+from fastapi import HTTPException, status
+from starlette.responses import JSONResponse
+from app.database import AsyncSessionLocal
+from app.middleware.auth import get_user_from_api_key, get_user_from_jwt
+
+
+# Paths that never require authentication
+PUBLIC_PATHS = frozenset({
+    "/",
+    "/health",
+    "/docs",
+    "/docs/oauth2-redirect",
+    "/redoc",
+    "/openapi.json",
+    "/auth/google",
+    "/auth/google/callback",
+    "/wallet/paystack/callback",
+    "/wallet/paystack/webhook",
+})
+
+BEARER_PREFIX = b"Bearer "
+
+CORS_ALLOW_METHODS = b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"
+CORS_MAX_AGE = b"600"
+CORS_EXPOSE_HEADERS = b"X-Next-Cursor"
+
+
+class CombinedMiddleware:
+    """
+    CORS and authentication in a single ASGI layer
+    Preflight requests are answered directly; every other response gets CORS headers.
+    The resolved AuthUser is stored on scope["state"]["auth_user"]
+    Priority: API key > JWT
+    """
+
+    def __init__(self, app, allow_origins=("*",), allow_credentials: bool = True):
+        self.app = app
+        self.allow_all_origins = "*" in allow_origins
+        self.allow_origins = frozenset(allow_origins)
+        self.allow_credentials = allow_credentials
+        # Route lookup, built from the app's routes on the first request
+        self.static_routes = None
+        self.param_routes = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Grab CORS and auth headers in one pass over the raw header list
+        origin = request_method = request_headers = None
+        api_key = authorization = None
+        for name, value in scope["headers"]:
+            if name == b"x-api-key":
+                api_key = value
+            elif name == b"authorization":
+                authorization = value
+            elif name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                request_method = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+
+        cors_headers = self.cors_headers(origin)
+        if cors_headers is not None:
+            if scope["method"] == "OPTIONS" and request_method is not None:
+                await self.preflight(cors_headers, request_headers, send)
+                return
+
+            async def send_with_cors(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = list(message.get("headers", ())) + cors_headers
+                await send(message)
+        else:
+            send_with_cors = send
+
+        # Only requests that reach a protected route are authenticated; unknown
+        # paths and wrong methods fall through to the router's 404/405
+        if scope["path"] not in PUBLIC_PATHS and self.is_routed(scope):
+            try:
+                auth_user = await self.authenticate(api_key, authorization)
+            except HTTPException as e:
+                response = JSONResponse(
+                    {"detail": e.detail},
+                    status_code=e.status_code,
+                    headers=e.headers,
+                )
+                await response(scope, receive, send_with_cors)
+                return
+            scope.setdefault("state", {})["auth_user"] = auth_user
+
+        await self.app(scope, receive, send_with_cors)
+
+    def is_routed(self, scope) -> bool:
+        """Whether the request fully matches one of the app's routes (path and method)"""
+        if self.static_routes is None:
+            self.build_route_lookup(scope["app"].router.routes)
+        method = scope["method"]
+        methods = self.static_routes.get(scope["path"], ())
+        if methods is None or method in methods:
+            return True
+        for path_regex, methods in self.param_routes:
+            if (methods is None or method in methods) and path_regex.match(scope["path"]):
+                return True
+        return False
+
+    def build_route_lookup(self, routes):
+        """
+        Index routes by path once: fixed paths in a dict, the few with path
+        parameters as (regex, methods) pairs. None methods accept any method
+        """
+        static_routes = {}
+        param_routes = []
+        for route in routes:
+            path_regex = getattr(route, "path_regex", None)
+            if path_regex is None:
+                continue
+            methods = getattr(route, "methods", None)
+            methods = frozenset(methods) if methods is not None else None
+            if route.param_convertors:
+                param_routes.append((path_regex, methods))
+            elif route.path in static_routes:
+                known = static_routes[route.path]
+                static_routes[route.path] = None if None in (known, methods) else known | methods
+            else:
+                static_routes[route.path] = methods
+        self.param_routes = param_routes
+        self.static_routes = static_routes
+
+    def cors_headers(self, origin):
+        """CORS response headers for an allowed origin, or None"""
+        if origin is None:
+            return None
+        if not self.allow_all_origins and origin.decode("latin-1") not in self.allow_origins:
+            return None
+        if self.allow_credentials:
+            # Credentialed requests can't use a wildcard origin
+            return [
+                (b"access-control-allow-origin", origin),
+                (b"access-control-allow-credentials", b"true"),
+                (b"access-control-expose-headers", CORS_EXPOSE_HEADERS),
+                (b"vary", b"Origin"),
+            ]
+        return [
+            (b"access-control-allow-origin", b"*" if self.allow_all_origins else origin),
+            (b"access-control-expose-headers", CORS_EXPOSE_HEADERS),
+        ]
+
+    async def preflight(self, cors_headers, request_headers, send):
+        """Answer a CORS preflight request"""
+        headers = cors_headers + [
+            (b"access-control-allow-methods", CORS_ALLOW_METHODS),
+            (b"access-control-max-age", CORS_MAX_AGE),
+            (b"content-type", b"text/plain; charset=utf-8"),
+            (b"content-length", b"2"),
+        ]
+        if request_headers is not None:
+            headers.append((b"access-control-allow-headers", request_headers))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": b"OK"})
+
+    async def authenticate(self, api_key, authorization):
+        """Resolve AuthUser from raw header values"""
+        if not api_key and not authorization:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Authentication required"
+            )
+
+        # Check for API key first
+        if api_key:
+            return await get_user_from_api_key(api_key.decode("latin-1"))
+
+        # Check for JWT token
+        if not authorization.startswith(BEARER_PREFIX):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid authorization header format"
+            )
+        token = authorization[len(BEARER_PREFIX):].decode("latin-1")
+        async with AsyncSessionLocal() as db:
+            return await get_user_from_jwt(token, db)
@@ -2,12 +2,17 @@
 Authentication middleware for JWT and API keys
 """
 
-from fastapi import HTTPException, status, Header, Depends
+from fastapi import HTTPException, status, Depends, Request
 from typing import Optional, List
-from sqlalchemy.orm import Session
-import json
-from app.database import get_db
-from app.models import User, APIKey
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from cachetools import TTLCache, TLRUCache
+from functools import cache
+import hashlib
+import time
+from app.models import User
+from app.middleware.api_key_batcher import api_key_batcher
 from app.services.auth_service import verify_jwt_token
 from app.config import settings
 
@@ -21,37 +26,63 @@ class AuthUser:
         self.is_api_key = permissions is not None
 
 
-async def get_current_user(
-    authorization: Optional[str] = Header(None),
-    x_api_key: Optional[str] = Header(None),
-    db: Session = Depends(get_db),
-) -> AuthUser:
+# Resolved credentials are cached briefly to skip DB lookups on hot paths.
+# Entries are keyed by a truncated SHA-256 so raw keys/tokens are never held.
+AUTH_CACHE_TTL = 30  # seconds; bounds how long a revocation can lag
+
+_PREFIX = settings.API_KEY_PREFIX
+
+# (user_id, email, permissions, expires_at) per API key
+_api_key_cache = TTLCache(maxsize=10000, ttl=AUTH_CACHE_TTL)
+
+# Unknown keys, so repeated bad keys don't each cost a lookup
+NEGATIVE_CACHE_TTL = 5  # seconds
+_api_key_negative_cache = TTLCache(maxsize=10000, ttl=NEGATIVE_CACHE_TTL)
+
+# (user_id, email, exp) per JWT, never cached past the token's own exp
+_jwt_cache = TLRUCache(
+    maxsize=10000,
+    ttu=lambda _key, value, now: now + min(AUTH_CACHE_TTL, value[2] - time.time()),
+)
+
+
+def _cache_key(secret: str) -> bytes:
+    """Build a cache key from an API key or token"""
+    return hashlib.sha256(secret.encode()).digest()[:16]
+
+
+def hash_api_key(api_key: str) -> bytes:
+    """Hash an API key for storage and lookup (raw keys are never stored)"""
+    return hashlib.sha256(api_key.encode()).digest()
+
+
+def invalidate_api_key(key_hash: bytes) -> None:
+    """Evict an API key from the auth caches"""
+    _api_key_cache.pop(key_hash[:16], None)
+    _api_key_negative_cache.pop(key_hash[:16], None)
+
+
+def get_current_user(request: Request) -> AuthUser:
     """
-    Get current authenticated user from JWT or API key
-    Priority: API key > JWT
+    Get current authenticated user
+    The user is resolved from JWT or API key by CombinedMiddleware
     """
-    # Check for API key first
-    if x_api_key:
-        return await get_user_from_api_key(x_api_key, db)
-    
-    # Check for JWT token
-    if authorization:
-        if not authorization.startswith("Bearer "):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authorization header format"
-            )
-        token = authorization.replace("Bearer ", "")
-        return await get_user_from_jwt(token, db)
-    
-    raise HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Authentication required"
-    )
+    auth_user = getattr(request.state, "auth_user", None)
+    if auth_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authentication required"
+        )
+    return auth_user
 
 
-async def get_user_from_jwt(token: str, db: Session) -> AuthUser:
+async def get_user_from_jwt(token: str, db: AsyncSession) -> AuthUser:
     """Get user from JWT token"""
+    cache_key = _cache_key(token)
+    cached = _jwt_cache.get(cache_key)
+    if cached and cached[2] > time.time():  # Never trust a cached token past its exp
+        return AuthUser(user_id=cached[0], email=cached[1])
+    
     payload = verify_jwt_token(token)
     if not payload:
         raise HTTPException(
@@ -62,67 +93,68 @@ async def get_user_from_jwt(token: str, db: Session) -> AuthUser:
     user_id = payload.get("user_id")
     email = payload.get("email")
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = (await db.execute(
+        select(User.id, User.email).where(User.id == user_id)
+    )).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
     
+    exp = payload.get("exp")
+    if exp:
+        _jwt_cache[cache_key] = (user.id, user.email, exp)
+    
     return AuthUser(user_id=user.id, email=user.email)
 
 
-async def get_user_from_api_key(api_key: str, db: Session) -> AuthUser:
+async def get_user_from_api_key(api_key: str) -> AuthUser:
     """Get user from API key"""
-    # Remove prefix if present
-    if api_key.startswith(settings.API_KEY_PREFIX):
-        key = api_key
-    else:
-        key = f"{settings.API_KEY_PREFIX}{api_key}"
-    
-    api_key_obj = db.query(APIKey).filter(APIKey.key == key).first()
-    if not api_key_obj:
+    # Keys must be sent in full, prefix included
+    if not api_key.startswith(_PREFIX):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid API key"
+            detail="Invalid or expired API key"
         )
     
-    if api_key_obj.is_revoked:
+    now = datetime.utcnow()
+    key_hash = hash_api_key(api_key)
+    cache_key = key_hash[:16]
+    cached = _api_key_cache.get(cache_key)
+    if cached and cached[3] > now:
+        return AuthUser(user_id=cached[0], email=cached[1], permissions=list(cached[2]))
+    if cache_key in _api_key_negative_cache:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="API key has been revoked"
+            detail="Invalid or expired API key"
         )
     
-    if api_key_obj.is_expired:
+    # Concurrent lookups are batched into a single query
+    row = await api_key_batcher.submit(key_hash)
+    if not row:
+        _api_key_negative_cache[cache_key] = True
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="API key has expired"
+            detail="Invalid or expired API key"
         )
     
-    user = db.query(User).filter(User.id == api_key_obj.user_id).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found"
-        )
-    
-    # Parse permissions
-    permissions = []
-    if api_key_obj.permissions:
-        try:
-            permissions = json.loads(api_key_obj.permissions)
-        except:
-            permissions = []
+    permissions = row.permissions or []
+    _api_key_cache[cache_key] = (row.user_id, row.email, tuple(permissions), row.expires_at)
     
     return AuthUser(
-        user_id=user.id,
-        email=user.email,
+        user_id=row.user_id,
+        email=row.email,
         permissions=permissions
     )
 
 
+@cache
 def require_permission(permission: str):
-    """Dependency to require specific permission"""
+    """
+    Dependency to require specific permission
+    One checker per permission, so FastAPI dedupes repeated Depends on a route
+    """
     async def permission_checker(current_user: AuthUser = Depends(get_current_user)) -> AuthUser:
         # JWT users have all permissions
         if not current_user.is_api_key:
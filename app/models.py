@@ -2,14 +2,33 @@
 Database models for the wallet service
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, Boolean, Text, Numeric
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, Enum, ForeignKey, Boolean, JSON, LargeBinary, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from sqlalchemy.sql.expression import FunctionElement
 from datetime import datetime
 import enum
 from app.database import Base
 
 
+class utcnow(FunctionElement):
+    """Database-side current UTC time, comparable with the naive UTC columns"""
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def _compile_utcnow(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"  # UTC on SQLite
+
+
+@compiles(utcnow, "postgresql")
+def _compile_utcnow_postgresql(element, compiler, **kw):
+    return "(now() AT TIME ZONE 'utc')"
+
+
 class TransactionType(str, enum.Enum):
     DEPOSIT = "deposit"
     TRANSFER = "transfer"
@@ -30,6 +49,9 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     name = Column(String)
     picture = Column(String, nullable=True)
+    # Upper bound on active API keys: +1 per reserved key slot.
+    # Expired keys are only dropped when the count is reconciled.
+    active_api_key_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -45,7 +67,7 @@ class Wallet(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), unique=True, index=True)
     wallet_number = Column(String, unique=True, index=True)  # Unique wallet identifier
-    balance = Column(Numeric(15, 2), default=0.00)  # Balance in Naira (stored as decimal)
+    balance = Column(BigInteger, default=0)  # Balance in kobo
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -67,10 +89,11 @@ class Transaction(Base):
     wallet_id = Column(Integer, ForeignKey("wallets.id"), nullable=True)
     recipient_wallet_id = Column(Integer, ForeignKey("wallets.id"), nullable=True)  # For transfers
     type = Column(Enum(TransactionType))
-    amount = Column(Numeric(15, 2))  # Amount in Naira
+    amount = Column(BigInteger)  # Amount in kobo
     status = Column(Enum(TransactionStatus), default=TransactionStatus.PENDING)
     authorization_url = Column(String, nullable=True)  # Paystack payment URL
-    description = Column(String, nullable=True)
+    description = Column(String, nullable=True)  # Transfers only; deposits are described at serialization
+    next_check_at = Column(DateTime, nullable=True)  # Pending deposits: next Paystack verification
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -80,14 +103,54 @@ class Transaction(Base):
     recipient_wallet = relationship("Wallet", foreign_keys=[recipient_wallet_id])
 
 
+# Serves a user's transaction history newest first (id breaks created_at ties)
+Index(
+    "ix_transactions_user_created",
+    Transaction.user_id,
+    Transaction.created_at.desc(),
+    Transaction.id.desc(),
+)
+
+# Serves the pending deposit verifier's scan of recent pending rows
+Index("ix_transactions_status_created", Transaction.status, Transaction.created_at)
+
+
+class WebhookEvent(Base):
+    """Inbox of accepted Paystack webhooks, processed after the response is sent"""
+    __tablename__ = "webhook_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    reference = Column(String, index=True)  # Deposit reference to credit
+    payload_hash = Column(LargeBinary(32), unique=True, nullable=False)  # SHA-256 of the raw payload
+    received_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True, index=True)  # Null until the credit has run
+    replay_attempts = Column(Integer, default=0, nullable=False)  # Failed replays so far
+    next_replay_at = Column(DateTime, nullable=True)  # Set after a failed replay (backoff)
+
+
 class APIKey(Base):
     __tablename__ = "api_keys"
+    __table_args__ = (
+        # Covers rollover's owner-scoped key lookup (ID lookups use the primary key)
+        Index("ix_api_keys_user_key_hash", "user_id", "key_hash"),
+        # Partial index for counting a user's unrevoked keys when reconciling the
+        # key counter (now() can't appear in an index predicate, so expiry is a key column).
+        # Predicates match how is_revoked == False renders, so the planner can use it
+        Index(
+            "ix_api_keys_user_unrevoked",
+            "user_id",
+            "expires_at",
+            postgresql_where=text("is_revoked = false"),
+            sqlite_where=text("is_revoked = 0"),
+        ),
+    )
     
-    id = Column(String, primary_key=True, index=True)  # Random hex string (12 chars)
+    id = Column(String, primary_key=True, index=True)  # Random hex string (16 chars)
     user_id = Column(Integer, ForeignKey("users.id"), index=True)
-    key = Column(String, unique=True, index=True)  # The actual API key
+    key_hash = Column(LargeBinary(32), unique=True, nullable=False)  # SHA-256 of the API key (its unique index serves auth lookups)
+    key_hint = Column(String)  # Masked API key for display
     name = Column(String)  # User-friendly name
-    permissions = Column(Text)  # JSON string of permissions array
+    permissions = Column(JSON().with_variant(JSONB(), "postgresql"))  # Permissions array
     expires_at = Column(DateTime)
     is_revoked = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -107,4 +170,3 @@ class APIKey(Base):
     def is_active(self):
         """Check if API key is active (not revoked and not expired)"""
         return not self.is_revoked and not self.is_expired
-
@@ -4,7 +4,7 @@ Authentication routes for Google OAuth
 
 from fastapi import APIRouter, HTTPException, status, Depends, Request
 from fastapi.responses import RedirectResponse, JSONResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from app.database import get_db
 from app.services.auth_service import get_google_auth_url, handle_google_callback
@@ -38,6 +38,8 @@ async def trigger_google_signin(request: Request):
 
 @router.get(
     "/google/callback",
+    response_model=JWTAuthResponse,
+    response_model_exclude_unset=True,
     summary="Complete Google Sign‑In and Get Token",
     description=(
         "You normally arrive here automatically after logging in with the link from /auth/google.\n"
@@ -49,7 +51,7 @@ async def trigger_google_signin(request: Request):
 )
 async def google_oauth_callback(
     code: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> JWTAuthResponse:
     if not code:
         raise HTTPException(
@@ -3,51 +3,117 @@ API key management routes
 """
 
 from fastapi import APIRouter, HTTPException, status, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from typing import List
-import json
+import base64
 import secrets
 from app.database import get_db
-from app.middleware.auth import get_current_user, AuthUser
-from app.models import APIKey
+from app.middleware.auth import get_current_user, AuthUser, hash_api_key, invalidate_api_key
+from app.models import APIKey, User, utcnow
 from app.schemas import CreateAPIKeyRequest, CreateAPIKeyResponse, RolloverAPIKeyRequest, APIKeyInfo
 from app.config import settings
 
 router = APIRouter(prefix="/keys", tags=["API Keys"])
 
+_PREFIX = settings.API_KEY_PREFIX
 
-def parse_expiry(expiry: str) -> datetime:
+
+# Key lifetimes by expiry code
+_EXPIRY = {
+    "1H": timedelta(hours=1),
+    "1D": timedelta(days=1),
+    "1M": timedelta(days=30),
+    "1Y": timedelta(days=365),
+}
+
+
+def parse_expiry(expiry: str, now: datetime) -> datetime:
     """Parse expiry string (1H, 1D, 1M, 1Y) to datetime"""
-    now = datetime.utcnow()
-    if expiry == "1H":
-        return now + timedelta(hours=1)
-    elif expiry == "1D":
-        return now + timedelta(days=1)
-    elif expiry == "1M":
-        return now + timedelta(days=30)
-    elif expiry == "1Y":
-        return now + timedelta(days=365)
-    else:
+    try:
+        return now + _EXPIRY[expiry]
+    except KeyError:
         raise ValueError("Invalid expiry format")
 
 
 def generate_api_key() -> str:
-    """Generate a new API key"""
-    random_part = secrets.token_urlsafe(32)
-    return f"{settings.API_KEY_PREFIX}{random_part}"
+    """Generate a new API key (128 bits of entropy)"""
+    random_part = base64.urlsafe_b64encode(secrets.token_bytes(16)).rstrip(b"=").decode("ascii")
+    return _PREFIX + random_part
 
 
 def generate_api_key_id() -> str:
-    """Generate a random hexadecimal ID (12 characters)"""
-    return secrets.token_hex(6)  # 6 bytes = 12 hex characters
+    """Generate a random hexadecimal ID (16 characters)"""
+    return secrets.token_hex(8)  # 8 bytes = 16 hex characters
+
+
+# Attempts at drawing a free key ID before giving up
+API_KEY_ID_ATTEMPTS = 3
+
+
+async def add_api_key(api_key_obj: APIKey, db: AsyncSession) -> None:
+    """
+    Insert a new API key, drawing a fresh ID on collision
+    The primary key constraint is the uniqueness check; each attempt runs in a
+    savepoint so a collision doesn't roll back the caller's key slot reservation
+    """
+    for attempt in range(API_KEY_ID_ATTEMPTS):
+        try:
+            async with db.begin_nested():
+                db.add(api_key_obj)
+            return
+        except IntegrityError:
+            if attempt == API_KEY_ID_ATTEMPTS - 1:
+                raise
+            api_key_obj.id = generate_api_key_id()
+
+
+async def reserve_api_key_slot(user_id: int, db: AsyncSession) -> bool:
+    """
+    Atomically take one of the user's active key slots
+    The counter is bumped with a guarded UPDATE in the caller's transaction.
+    Since expired keys are still included in the counter, a full counter is
+    reconciled once and retried; the reconcile holds the user row lock so a
+    concurrent reservation can't be overwritten by a stale recount.
+    The reservation is released if the transaction rolls back.
+    """
+    reserve = update(User).where(
+        User.id == user_id,
+        User.active_api_key_count < settings.MAX_ACTIVE_KEYS_PER_USER
+    ).values(active_api_key_count=User.active_api_key_count + 1)
+    
+    if (await db.execute(reserve)).rowcount:
+        return True
+    
+    # A guarded UPDATE that matched nothing took no row lock, so lock the user
+    # first; a concurrent reservation then commits before we count
+    # (SQLite serializes writers already, FOR UPDATE is omitted there)
+    await db.execute(select(User.id).where(User.id == user_id).with_for_update())
+    
+    # Recount and reconcile the counter; counting stops at the limit,
+    # which is all the guarded UPDATE needs to know
+    active_keys = await db.scalar(
+        select(func.count()).select_from(
+            select(APIKey.id).where(
+                APIKey.user_id == user_id,
+                APIKey.is_revoked == False,
+                APIKey.expires_at > utcnow()
+            ).limit(settings.MAX_ACTIVE_KEYS_PER_USER).subquery()
+        )
+    )
+    await db.execute(
+        update(User).where(User.id == user_id).values(active_api_key_count=active_keys)
+    )
+    return bool((await db.execute(reserve)).rowcount)
 
 
 @router.post(
     "/create", 
     response_model=CreateAPIKeyResponse, 
+    response_model_exclude_unset=True,
     status_code=201,
-    dependencies=[Depends(get_current_user)],
     summary="Create API Key",
     description=(
         "Creates a new API key you can use instead of a JWT.\n"
@@ -69,63 +135,49 @@ def generate_api_key_id() -> str:
 async def create_api_key(
     request: CreateAPIKeyRequest,
     current_user: AuthUser = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Create a new API key with specified permissions
     Maximum 5 active keys per user
     """
-    # Check active key count
-    active_keys = db.query(APIKey).filter(
-        APIKey.user_id == current_user.user_id,
-        APIKey.is_revoked == False,
-        APIKey.expires_at > datetime.utcnow()
-    ).count()
-    
-    if active_keys >= settings.MAX_ACTIVE_KEYS_PER_USER:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Maximum {settings.MAX_ACTIVE_KEYS_PER_USER} active API keys allowed per user"
-        )
-    
-    # Validate permissions
-    valid_permissions = ["deposit", "transfer", "read"]
-    for perm in request.permissions:
-        if perm not in valid_permissions:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid permission: {perm}. Valid permissions: {valid_permissions}"
-            )
+    now = datetime.utcnow()
     
     # Parse expiry
     try:
-        expires_at = parse_expiry(request.expiry)
+        expires_at = parse_expiry(request.expiry, now)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
     
+    # Reserve an active key slot (committed together with the new key)
+    if not await reserve_api_key_slot(current_user.user_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Maximum {settings.MAX_ACTIVE_KEYS_PER_USER} active API keys allowed per user"
+        )
+    
     # Generate API key and ID
     api_key = generate_api_key()
     api_key_id = generate_api_key_id()
     
-    # Ensure ID is unique
-    while db.query(APIKey).filter(APIKey.id == api_key_id).first():
-        api_key_id = generate_api_key_id()
-    
     # Create API key record
+    key_hash = hash_api_key(api_key)
     api_key_obj = APIKey(
         id=api_key_id,
         user_id=current_user.user_id,
-        key=api_key,
+        key_hash=key_hash,
+        key_hint=mask_api_key(api_key),
         name=request.name,
-        permissions=json.dumps(request.permissions),
+        permissions=request.permissions,
         expires_at=expires_at,
     )
-    db.add(api_key_obj)
-    db.commit()
-    db.refresh(api_key_obj)
+    await add_api_key(api_key_obj, db)
+    await db.commit()
+    await db.refresh(api_key_obj)
+    invalidate_api_key(key_hash)
     
     return CreateAPIKeyResponse(
         api_key_id=api_key_obj.id,
@@ -137,8 +189,8 @@ async def create_api_key(
 @router.post(
     "/rollover",
     response_model=CreateAPIKeyResponse,
+    response_model_exclude_unset=True,
     status_code=201,
-    dependencies=[Depends(get_current_user)],
     summary="Rollover Expired API Key",
     description=(
         "Creates a fresh API key using the same permissions as an expired one.\n"
@@ -153,35 +205,30 @@ async def create_api_key(
 async def rollover_api_key(
     request: RolloverAPIKeyRequest,
     current_user: AuthUser = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Rollover an expired API key
     Creates a new key with the same permissions as the expired one
     """
-    # Find the expired key - try by ID first (hex string, 12 characters), then by key string
-    expired_key = None
-    # Try finding by ID (hex string, 12 characters)
-    if len(request.expired_key_id) == 12 and all(c in '0123456789abcdef' for c in request.expired_key_id.lower()):
-        expired_key = db.query(APIKey).filter(
-            APIKey.id == request.expired_key_id.lower(),
-            APIKey.user_id == current_user.user_id
-        ).first()
+    now = datetime.utcnow()
     
-    if not expired_key:
-        # Try finding by key string
-        expired_key = db.query(APIKey).filter(
-            APIKey.key == request.expired_key_id,
-            APIKey.user_id == current_user.user_id
-        ).first()
-        
-        # Also try with prefix if not found
-        if not expired_key and not request.expired_key_id.startswith(settings.API_KEY_PREFIX):
-            key_with_prefix = f"{settings.API_KEY_PREFIX}{request.expired_key_id}"
-            expired_key = db.query(APIKey).filter(
-                APIKey.key == key_with_prefix,
-                APIKey.user_id == current_user.user_id
-            ).first()
+    # Find the expired key by ID (hex string, 16 or legacy 12 characters) or by key string;
+    # a key given without its prefix is prefixed once before hashing
+    candidate = request.expired_key_id
+    if len(candidate) in (12, 16) and all(c in '0123456789abcdef' for c in candidate.lower()):
+        condition = APIKey.id == candidate.lower()
+    elif candidate.startswith(_PREFIX):
+        condition = APIKey.key_hash == hash_api_key(candidate)
+    else:
+        condition = APIKey.key_hash == hash_api_key(_PREFIX + candidate)
+    
+    expired_key = await db.scalar(
+        select(APIKey).where(
+            APIKey.user_id == current_user.user_id,
+            condition
+        ).limit(1)
+    )
     
     if not expired_key:
         raise HTTPException(
@@ -190,62 +237,48 @@ async def rollover_api_key(
         )
     
     # Verify it's actually expired
-    if not expired_key.is_expired:
+    if expired_key.expires_at > now:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="API key is not expired. Only expired keys can be rolled over"
         )
     
-    # Check active key count
-    active_keys = db.query(APIKey).filter(
-        APIKey.user_id == current_user.user_id,
-        APIKey.is_revoked == False,
-        APIKey.expires_at > datetime.utcnow()
-    ).count()
-    
-    if active_keys >= settings.MAX_ACTIVE_KEYS_PER_USER:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Maximum {settings.MAX_ACTIVE_KEYS_PER_USER} active API keys allowed per user"
-        )
-    
     # Parse expiry
     try:
-        expires_at = parse_expiry(request.expiry)
+        expires_at = parse_expiry(request.expiry, now)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
     
-    # Get permissions from expired key
-    permissions = []
-    if expired_key.permissions:
-        try:
-            permissions = json.loads(expired_key.permissions)
-        except:
-            permissions = []
+    # Reserve an active key slot (committed together with the new key)
+    if not await reserve_api_key_slot(current_user.user_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Maximum {settings.MAX_ACTIVE_KEYS_PER_USER} active API keys allowed per user"
+        )
     
     # Generate new API key and ID
     api_key = generate_api_key()
     api_key_id = generate_api_key_id()
     
-    # Ensure ID is unique
-    while db.query(APIKey).filter(APIKey.id == api_key_id).first():
-        api_key_id = generate_api_key_id()
-    
     # Create new API key with same permissions
+    key_hash = hash_api_key(api_key)
     new_api_key = APIKey(
         id=api_key_id,
         user_id=current_user.user_id,
-        key=api_key,
+        key_hash=key_hash,
+        key_hint=mask_api_key(api_key),
         name=f"{expired_key.name} (rolled over)",
-        permissions=json.dumps(permissions),
+        permissions=expired_key.permissions or [],
         expires_at=expires_at,
     )
-    db.add(new_api_key)
-    db.commit()
-    db.refresh(new_api_key)
+    await add_api_key(new_api_key, db)
+    await db.commit()
+    await db.refresh(new_api_key)
+    invalidate_api_key(expired_key.key_hash)
+    invalidate_api_key(key_hash)
     
     return CreateAPIKeyResponse(
         api_key_id=new_api_key.id,
@@ -269,41 +302,36 @@ async def rollover_api_key(
 )
 async def list_api_keys(
     current_user: AuthUser = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     List all API keys for the current user
     Returns active, expired, and revoked keys
     Use this to find expired key IDs for rollover
     """
-    api_keys = db.query(APIKey).filter(
-        APIKey.user_id == current_user.user_id
-    ).order_by(APIKey.created_at.desc()).all()
+    api_keys = (await db.scalars(
+        select(APIKey).where(
+            APIKey.user_id == current_user.user_id
+        ).order_by(APIKey.created_at.desc())
+    )).all()
     
-    result = []
-    for key in api_keys:
-        permissions = []
-        if key.permissions:
-            try:
-                permissions = json.loads(key.permissions)
-            except:
-                permissions = []
-        
-        # Mask the API key for security (show only first 8 and last 4 characters)
-        masked_key = mask_api_key(key.key)
-        
-        result.append(APIKeyInfo(
+    return [
+        APIKeyInfo(
             id=key.id,
             name=key.name,
-            api_key=masked_key,
-            permissions=permissions,
+            api_key=key.key_hint or "",
+            permissions=key.permissions or [],
             expires_at=key.expires_at,
             is_revoked=key.is_revoked,
             is_expired=key.is_expired,
             created_at=key.created_at,
-        ))
-    
-    return result
+        )
+        for key in api_keys
+    ]
+
+
+# Fixed-width middle of a masked key (also hides the key's length)
+_MASK_MID = "*" * 20
 
 
 def mask_api_key(api_key: str) -> str:
@@ -316,9 +344,5 @@ def mask_api_key(api_key: str) -> str:
         return api_key[:4] + "..." + "*" * (len(api_key) - 4)
     
     # Show first 8 characters and last 4 characters
-    prefix = api_key[:8]
-    suffix = api_key[-4:]
-    masked_length = len(api_key) - 12  # Total length minus visible parts
-    
-    return f"{prefix}{'*' * min(masked_length, 20)}...{suffix}"
+    return f"{api_key[:8]}{_MASK_MID}...{api_key[-4:]}"
 
@@ -2,27 +2,40 @@
 Wallet routes for deposits, transfers, and transactions
 """
 
-from fastapi import APIRouter, HTTPException, status, Depends, Request
-from sqlalchemy.orm import Session
-from decimal import Decimal
-import json
+from fastapi import APIRouter, BackgroundTasks, HTTPException, status, Depends, Query, Request, Response
+from fastapi.responses import HTMLResponse
+from typing import Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+import brotli
+import hashlib
+import html
+import orjson
+from string import Template
+from app.config import settings
 from app.database import get_db
 from app.middleware.auth import get_current_user, AuthUser, require_permission
 from app.services.paystack_service import (
     initiate_paystack_payment,
-    verify_paystack_transaction,
     verify_paystack_webhook_signature,
     generate_payment_reference,
 )
 from app.services.wallet_service import (
-    get_wallet_balance,
+    get_wallet_summary,
     create_deposit_transaction,
-    credit_wallet_from_deposit,
+    set_deposit_authorization_url,
+    delete_pending_deposit,
+    record_webhook_event,
+    process_webhook_event,
     transfer_funds,
     get_transaction_history,
-    get_transaction_by_reference,
+    get_deposit_outcome,
+    get_transaction_by_reference_for_user,
+    encode_cursor,
+    decode_cursor,
+    get_transaction_cursor,
 )
-from app.models import User, Transaction, TransactionStatus, Wallet
+from app.models import User, TransactionStatus
 from app.schemas import (
     DepositRequest,
     DepositResponse,
@@ -32,16 +45,203 @@ from app.schemas import (
     TransferResponse,
     TransactionResponse,
     WebhookResponse,
+    format_naira,
 )
 
 router = APIRouter(prefix="/wallet", tags=["Wallet"])
 
 
+# Attempts at inserting a deposit under a fresh reference
+DEPOSIT_REFERENCE_ATTEMPTS = 2
+
+# Constant webhook acknowledgement (WebhookResponse(status=True)), serialized once.
+# A fresh Response wraps it per request since responses are mutable
+WEBHOOK_OK = b'{"status":true}'
+
+
+# Callback pages carry the reference and amount, so they're compressed per response;
+# at this quality a ~2 KB page takes microseconds and shrinks about 4x
+CALLBACK_BROTLI_QUALITY = 5
+
+
+def callback_page(request: Request, page: str) -> HTMLResponse:
+    """Serve a rendered callback page, brotli-compressed when the client accepts it"""
+    body = page.encode()
+    if "br" not in request.headers.get("accept-encoding", ""):
+        return HTMLResponse(content=body, headers={"Vary": "Accept-Encoding"})
+    return HTMLResponse(
+        content=brotli.compress(body, mode=brotli.MODE_TEXT, quality=CALLBACK_BROTLI_QUALITY),
+        headers={"Content-Encoding": "br", "Vary": "Accept-Encoding"},
+    )
+
+
+# Payment callback pages, parsed once at import ($reference is HTML-escaped by the handler)
+SUCCESS_TMPL = Template("""\
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Payment Successful</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            height: 100vh;
+            margin: 0;
+            background-color: #f5f5f5;
+        }
+        .container {
+            text-align: center;
+            background: white;
+            padding: 40px;
+            border-radius: 10px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+        }
+        .success {
+            color: #28a745;
+            font-size: 48px;
+            margin-bottom: 20px;
+        }
+        h1 {
+            color: #333;
+            margin-bottom: 10px;
+        }
+        p {
+            color: #666;
+            margin: 10px 0;
+        }
+        .reference {
+            background: #f8f9fa;
+            padding: 10px;
+            border-radius: 5px;
+            font-family: monospace;
+            margin: 20px 0;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="success">✓</div>
+        <h1>Payment Successful!</h1>
+        <p>Your payment has been processed successfully.</p>
+        <p>Reference: <span class="reference">$reference</span></p>
+        <p>Amount: ₦$amount</p>
+        <p style="margin-top: 30px; color: #999; font-size: 14px;">
+            Your wallet will be credited shortly. You can close this window.
+        </p>
+    </div>
+</body>
+</html>
+""")
+
+FAILED_TMPL = Template("""\
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Payment Failed</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            height: 100vh;
+            margin: 0;
+            background-color: #f5f5f5;
+        }
+        .container {
+            text-align: center;
+            background: white;
+            padding: 40px;
+            border-radius: 10px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+        }
+        .error {
+            color: #dc3545;
+            font-size: 48px;
+            margin-bottom: 20px;
+        }
+        h1 {
+            color: #333;
+            margin-bottom: 10px;
+        }
+        p {
+            color: #666;
+            margin: 10px 0;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="error">✗</div>
+        <h1>Payment Failed</h1>
+        <p>Your payment could not be processed.</p>
+        <p>Reference: <span style="font-family: monospace; background: #f8f9fa; padding: 5px 10px; border-radius: 3px;">$reference</span></p>
+        <p style="margin-top: 30px; color: #999; font-size: 14px;">
+            Please try again or contact support.
+        </p>
+    </div>
+</body>
+</html>
+""")
+
+PENDING_TMPL = Template("""\
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Payment Processing</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            height: 100vh;
+            margin: 0;
+            background-color: #f5f5f5;
+        }
+        .container {
+            text-align: center;
+            background: white;
+            padding: 40px;
+            border-radius: 10px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+        }
+        .pending {
+            color: #ffc107;
+            font-size: 48px;
+            margin-bottom: 20px;
+        }
+        h1 {
+            color: #333;
+            margin-bottom: 10px;
+        }
+        p {
+            color: #666;
+            margin: 10px 0;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="pending">⏳</div>
+        <h1>Payment Processing</h1>
+        <p>Your payment is being processed.</p>
+        <p>Reference: <span style="font-family: monospace; background: #f8f9fa; padding: 5px 10px; border-radius: 3px;">$reference</span></p>
+        <p style="margin-top: 30px; color: #999; font-size: 14px;">
+            Please wait while we confirm your payment. You can check the status later.
+        </p>
+    </div>
+</body>
+</html>
+""")
+
+
 @router.post(
     "/deposit", 
     response_model=DepositResponse, 
     status_code=201,
-    dependencies=[Depends(require_permission("deposit"))],
     summary="Deposit Funds",
     description=(
         "Start a Paystack payment to add money to your wallet.\n"
@@ -56,7 +256,7 @@ router = APIRouter(prefix="/wallet", tags=["Wallet"])
 async def deposit_funds(
     request: DepositRequest,
     current_user: AuthUser = Depends(require_permission("deposit")),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Initiate wallet deposit using Paystack
@@ -69,51 +269,60 @@ async def deposit_funds(
         )
     
     # Get user
-    user = db.query(User).filter(User.id == current_user.user_id).first()
+    user = await db.get(User, current_user.user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    # Generate unique reference
-    reference = generate_payment_reference()
-    
-    # Check for duplicate reference (idempotency)
-    existing_transaction = db.query(Transaction).filter(
-        Transaction.reference == reference
-    ).first()
-    if existing_transaction:
-        return DepositResponse(
-            reference=existing_transaction.reference,
-            authorization_url=existing_transaction.authorization_url or "",
-        )
+    # Read before any rollback below expires the loaded user
+    email = user.email
     
     try:
-        # Initialize Paystack payment
-        paystack_response = await initiate_paystack_payment(
-            request.amount,
-            user.email,
-            reference,
-        )
+        # References are random; the unique reference constraint catches the
+        # (practically impossible) collision, which gets one retry with a new reference.
+        # The row is inserted first so Paystack only ever hears of references we own
+        for attempt in range(DEPOSIT_REFERENCE_ATTEMPTS):
+            reference = generate_payment_reference()
+            try:
+                await create_deposit_transaction(
+                    current_user.user_id,
+                    request.amount,
+                    reference,
+                    None,
+                    db,
+                )
+                break
+            except IntegrityError:
+                await db.rollback()
+                if attempt == DEPOSIT_REFERENCE_ATTEMPTS - 1:
+                    raise
         
-        authorization_url = paystack_response["data"]["authorization_url"]
-        amount_naira = Decimal(request.amount) / 100  # Convert kobo to Naira
+        try:
+            paystack_response = await initiate_paystack_payment(
+                request.amount,
+                email,
+                reference,
+            )
+            authorization_url = paystack_response["data"]["authorization_url"]
+        except Exception:
+            # No payment to complete; don't leave the row in the user's history
+            await delete_pending_deposit(current_user.user_id, reference, db)
+            raise
         
-        # Create transaction record
-        create_deposit_transaction(
-            current_user.user_id,
-            amount_naira,
-            reference,
-            authorization_url,
-            db,
-        )
+        await set_deposit_authorization_url(reference, authorization_url, db)
         
         return DepositResponse(
             reference=reference,
             authorization_url=authorization_url,
         )
     
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Duplicate payment reference, please try again"
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -126,11 +335,12 @@ async def deposit_funds(
         )
 
 
-@router.get("/paystack/callback")
+@router.get("/paystack/callback", response_class=HTMLResponse)
 async def paystack_callback(
+    request: Request,
     reference: str,
     trxref: str = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Paystack payment callback (user redirect after payment)
@@ -138,196 +348,73 @@ async def paystack_callback(
     Shows a success/failure message to the user.
     Note: The actual wallet crediting happens via webhook, not here.
     """
-    from fastapi.responses import HTMLResponse
+    # Verify transaction status (reloads of a successful payment hit the cache)
+    outcome = await get_deposit_outcome(reference, db)
+    safe_reference = html.escape(reference)
     
-    # Verify transaction status
-    transaction = get_transaction_by_reference(reference, db)
-    
-    if transaction:
-        if transaction.status == TransactionStatus.SUCCESS:
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Payment Successful</title>
-                <style>
-                    body {{
-                        font-family: Arial, sans-serif;
-                        display: flex;
-                        justify-content: center;
-                        align-items: center;
-                        height: 100vh;
-                        margin: 0;
-                        background-color: #f5f5f5;
-                    }}
-                    .container {{
-                        text-align: center;
-                        background: white;
-                        padding: 40px;
-                        border-radius: 10px;
-                        box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-                    }}
-                    .success {{
-                        color: #28a745;
-                        font-size: 48px;
-                        margin-bottom: 20px;
-                    }}
-                    h1 {{
-                        color: #333;
-                        margin-bottom: 10px;
-                    }}
-                    p {{
-                        color: #666;
-                        margin: 10px 0;
-                    }}
-                    .reference {{
-                        background: #f8f9fa;
-                        padding: 10px;
-                        border-radius: 5px;
-                        font-family: monospace;
-                        margin: 20px 0;
-                    }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="success">✓</div>
-                    <h1>Payment Successful!</h1>
-                    <p>Your payment has been processed successfully.</p>
-                    <p>Reference: <span class="reference">{reference}</span></p>
-                    <p>Amount: ₦{transaction.amount:,.2f}</p>
-                    <p style="margin-top: 30px; color: #999; font-size: 14px;">
-                        Your wallet will be credited shortly. You can close this window.
-                    </p>
-                </div>
-            </body>
-            </html>
-            """
-            return HTMLResponse(content=html_content)
-        elif transaction.status == TransactionStatus.FAILED:
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Payment Failed</title>
-                <style>
-                    body {{
-                        font-family: Arial, sans-serif;
-                        display: flex;
-                        justify-content: center;
-                        align-items: center;
-                        height: 100vh;
-                        margin: 0;
-                        background-color: #f5f5f5;
-                    }}
-                    .container {{
-                        text-align: center;
-                        background: white;
-                        padding: 40px;
-                        border-radius: 10px;
-                        box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-                    }}
-                    .error {{
-                        color: #dc3545;
-                        font-size: 48px;
-                        margin-bottom: 20px;
-                    }}
-                    h1 {{
-                        color: #333;
-                        margin-bottom: 10px;
-                    }}
-                    p {{
-                        color: #666;
-                        margin: 10px 0;
-                    }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="error">✗</div>
-                    <h1>Payment Failed</h1>
-                    <p>Your payment could not be processed.</p>
-                    <p>Reference: <span style="font-family: monospace; background: #f8f9fa; padding: 5px 10px; border-radius: 3px;">{reference}</span></p>
-                    <p style="margin-top: 30px; color: #999; font-size: 14px;">
-                        Please try again or contact support.
-                    </p>
-                </div>
-            </body>
-            </html>
-            """
-            return HTMLResponse(content=html_content)
+    if outcome:
+        transaction_status, amount = outcome
+        if transaction_status == TransactionStatus.SUCCESS:
+            return callback_page(request, SUCCESS_TMPL.substitute(
+                reference=safe_reference,
+                amount=format_naira(amount),
+            ))
+        elif transaction_status == TransactionStatus.FAILED:
+            return callback_page(request, FAILED_TMPL.substitute(reference=safe_reference))
     
     # Transaction not found or still pending
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Payment Processing</title>
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                height: 100vh;
-                margin: 0;
-                background-color: #f5f5f5;
-            }}
-            .container {{
-                text-align: center;
-                background: white;
-                padding: 40px;
-                border-radius: 10px;
-                box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-            }}
-            .pending {{
-                color: #ffc107;
-                font-size: 48px;
-                margin-bottom: 20px;
-            }}
-            h1 {{
-                color: #333;
-                margin-bottom: 10px;
-            }}
-            p {{
-                color: #666;
-                margin: 10px 0;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="pending">⏳</div>
-            <h1>Payment Processing</h1>
-            <p>Your payment is being processed.</p>
-            <p>Reference: <span style="font-family: monospace; background: #f8f9fa; padding: 5px 10px; border-radius: 3px;">{reference}</span></p>
-            <p style="margin-top: 30px; color: #999; font-size: 14px;">
-                Please wait while we confirm your payment. You can check the status later.
-            </p>
-        </div>
-    </body>
-    </html>
-    """
-    return HTMLResponse(content=html_content)
+    return callback_page(request, PENDING_TMPL.substitute(reference=safe_reference))
 
 
 @router.post(
     "/paystack/webhook",
     response_model=WebhookResponse,
+    status_code=status.HTTP_202_ACCEPTED,
     summary="Paystack Webhook (automatic)",
     description=(
         "This is called by Paystack automatically after payment.\n"
         "You do NOT need to trigger this manually.\n"
-        "It validates the signature and credits the wallet if the payment succeeded."
+        "It validates the signature, records the event and credits the wallet\n"
+        "in the background if the payment succeeded."
     )
 )
-async def paystack_webhook(request: Request, db: Session = Depends(get_db)):
+async def paystack_webhook(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+):
     """
     Paystack webhook endpoint
     Receives transaction updates from Paystack
-    Only webhooks can credit wallets
+    Only webhooks can credit wallets; the credit runs after the 202 is sent
     """
-    payload = await request.body()
+    # Reject on headers before buffering anything
+    # Media types are case-insensitive; parameters such as charset are ignored
+    media_type = request.headers.get("content-type", "").partition(";")[0].strip().lower()
+    if media_type != "application/json":
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Webhook payload must be application/json"
+        )
+    content_length = request.headers.get("content-length")
+    if content_length is not None and (
+        not content_length.isdigit() or int(content_length) > settings.MAX_WEBHOOK_PAYLOAD_BYTES
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Webhook payload too large"
+        )
+    
+    # Chunked bodies carry no length, so the cap is also enforced while reading
+    payload = bytearray()
+    async for chunk in request.stream():
+        payload += chunk
+        if len(payload) > settings.MAX_WEBHOOK_PAYLOAD_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail="Webhook payload too large"
+            )
+    payload = bytes(payload)
     signature = request.headers.get("x-paystack-signature", "")
     
     # Verify signature
@@ -338,22 +425,29 @@ async def paystack_webhook(request: Request, db: Session = Depends(get_db)):
         )
     
     try:
-        event_data = json.loads(payload)
+        event_data = orjson.loads(payload)
         
         if event_data.get("event") == "charge.success":
             transaction_data = event_data.get("data", {})
             reference = transaction_data.get("reference")
             
             if reference:
-                # Credit wallet (idempotent operation)
-                success = credit_wallet_from_deposit(reference, db)
-                if not success:
-                    # Transaction not found or already processed
-                    pass
+                # Persist to the inbox first so a crash before the credit can be replayed;
+                # redelivered payloads hit the unique hash and are acknowledged as-is
+                event_id = await record_webhook_event(
+                    reference, hashlib.sha256(payload).digest(), db
+                )
+                if event_id is not None:
+                    # Fresh session inside the task; the request-scoped one is closed by then
+                    background_tasks.add_task(process_webhook_event, event_id, reference)
         
-        return WebhookResponse(status=True)
+        return Response(
+            content=WEBHOOK_OK,
+            status_code=status.HTTP_202_ACCEPTED,
+            media_type="application/json",
+        )
     
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid JSON payload"
@@ -380,14 +474,15 @@ async def paystack_webhook(request: Request, db: Session = Depends(get_db)):
 async def get_deposit_status(
     reference: str,
     current_user: AuthUser = Depends(require_permission("read")),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Get deposit transaction status
     This endpoint does NOT credit wallets - only webhooks can do that
     Requires 'read' permission
     """
-    transaction = get_transaction_by_reference(reference, db)
+    # Ownership is part of the lookup; other users' references are simply not found
+    transaction = await get_transaction_by_reference_for_user(reference, current_user.user_id, db)
     
     if not transaction:
         raise HTTPException(
@@ -395,32 +490,9 @@ async def get_deposit_status(
             detail="Transaction not found"
         )
     
-    # Verify transaction belongs to user
-    if transaction.user_id != current_user.user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
-    
-    # Optionally verify with Paystack (but don't credit wallet)
-    if transaction.status == TransactionStatus.PENDING:
-        try:
-            paystack_data = await verify_paystack_transaction(reference)
-            transaction_data = paystack_data.get("data", {})
-            
-            if transaction_data.get("status") == "success":
-                transaction.status = TransactionStatus.SUCCESS
-            elif transaction_data.get("status") == "failed":
-                transaction.status = TransactionStatus.FAILED
-            
-            db.commit()
-            db.refresh(transaction)
-        except:
-            pass  # If verification fails, return current status
-    
     # Generate message based on status
     if transaction.status == TransactionStatus.SUCCESS:
-        message = f"{transaction.amount:,.2f} Naira added to your wallet successfully"
+        message = f"{format_naira(transaction.amount)} Naira added to your wallet successfully"
     elif transaction.status == TransactionStatus.FAILED:
         message = "Failed transaction, please try again in the next 2 minutes"
     else:  # PENDING
@@ -437,28 +509,21 @@ async def get_deposit_status(
 @router.get(
     "/balance", 
     response_model=WalletBalanceResponse,
-    dependencies=[Depends(require_permission("read"))],
     summary="Get Wallet Balance",
     description="Shows your current wallet balance. Click 'Try it out' → 'Execute'."
 )
 async def get_balance(
     current_user: AuthUser = Depends(require_permission("read")),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Get wallet balance
     Requires 'read' permission
     """
     try:
-        balance = get_wallet_balance(current_user.user_id, db)
-        # Get wallet number
-        wallet = db.query(Wallet).filter(Wallet.user_id == current_user.user_id).first()
-        if not wallet:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Wallet not found"
-            )
-        return WalletBalanceResponse(balance=balance, wallet_number=wallet.wallet_number)
+        # Balance and wallet number in one (briefly cached) lookup
+        balance, wallet_number = await get_wallet_summary(current_user.user_id, db)
+        return WalletBalanceResponse(balance=balance, wallet_number=wallet_number)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -482,7 +547,7 @@ async def get_balance(
 async def transfer_funds_to_wallet(
     request: TransferRequest,
     current_user: AuthUser = Depends(require_permission("transfer")),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Transfer funds to another user's wallet
@@ -495,17 +560,16 @@ async def transfer_funds_to_wallet(
         )
     
     try:
-        amount_naira = Decimal(request.amount) / 100  # Convert kobo to Naira
-        transaction = transfer_funds(
+        transaction = await transfer_funds(
             current_user.user_id,
             request.wallet_number,
-            amount_naira,
+            request.amount,
             db,
         )
         
         return TransferResponse(
             status="success",
-            message=f"{amount_naira:,.2f} Naira transferred to {request.wallet_number}",
+            message=f"{format_naira(request.amount)} Naira transferred to {request.wallet_number}",
             reference=transaction.reference,
         )
     
@@ -541,15 +605,21 @@ async def transfer_funds_to_wallet(
         "See your deposits, transfers, and received transactions.\n"
         "Steps:\n"
         "1) Click 'Try it out'.\n"
-        "2) Optionally set 'limit' (max 100) and 'offset' for paging.\n"
-        "3) Execute to view your history."
+        "2) Optionally set 'limit' (max 100).\n"
+        "3) Execute to view your history.\n"
+        "4) For the next page, pass the 'X-Next-Cursor' response header as 'cursor',\n"
+        "   or the id of the last transaction you received as 'before_id'.\n"
+        "'offset' still works but is deprecated."
     )
 )
 async def get_transactions(
+    response: Response,
     limit: int = 50,
-    offset: int = 0,
+    cursor: Optional[str] = None,
+    before_id: Optional[int] = None,
+    offset: int = Query(0, deprecated=True),
     current_user: AuthUser = Depends(require_permission("read")),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Get transaction history
@@ -560,13 +630,30 @@ async def get_transactions(
     if limit < 1:
         limit = 10
     
+    before = None
+    try:
+        if cursor:
+            before = decode_cursor(cursor)
+        elif before_id is not None:
+            before = await get_transaction_cursor(current_user.user_id, before_id, db)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
     try:
-        transactions = get_transaction_history(
+        transactions = await get_transaction_history(
             current_user.user_id,
             limit=limit,
             offset=offset,
             db=db,
+            before=before,
         )
+        response.headers["Cache-Control"] = f"private, max-age={settings.TRANSACTIONS_CACHE_TTL}"
+        if len(transactions) == limit:
+            last = transactions[-1]
+            response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
         return transactions
     except Exception as e:
         raise HTTPException(
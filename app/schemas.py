@@ -2,10 +2,9 @@
 Pydantic schemas for request/response validation
 """
 
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, PlainSerializer, StrictInt, field_serializer
+from typing import Annotated, Optional, List, Literal
 from datetime import datetime
-from decimal import Decimal
 
 
 # Auth Schemas
@@ -22,25 +21,29 @@ class JWTAuthResponse(BaseModel):
 
 
 # API Key Schemas
+Permission = Literal["deposit", "transfer", "read"]
+Expiry = Literal["1H", "1D", "1M", "1Y"]  # Hour, Day, Month, Year
+
+
 class CreateAPIKeyRequest(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
-    permissions: List[str] = Field(..., min_items=1)
-    expiry: str = Field(..., pattern="^(1H|1D|1M|1Y)$")  # Hour, Day, Month, Year
+    permissions: List[Permission] = Field(..., min_length=1, max_length=3)
+    expiry: Expiry
 
 
 class CreateAPIKeyResponse(BaseModel):
-    api_key_id: str  # Random hex string (12 characters)
+    api_key_id: str  # Random hex string (16 characters)
     api_key: str
     expires_at: datetime
 
 
 class RolloverAPIKeyRequest(BaseModel):
     expired_key_id: str
-    expiry: str = Field(..., pattern="^(1H|1D|1M|1Y)$")
+    expiry: Expiry
 
 
 class APIKeyInfo(BaseModel):
-    id: str  # Random hex string (12 characters)
+    id: str  # Random hex string (16 characters)
     name: str
     api_key: str  # Masked/encrypted version
     permissions: List[str]
@@ -50,6 +53,23 @@ class APIKeyInfo(BaseModel):
     created_at: datetime
 
 
+def format_naira(kobo: int, separator: str = ",") -> str:
+    """
+    Format a kobo amount as Naira, e.g. 102000 -> '1,020.00'
+    Responses use separator="" for the plain '1020.00' form
+    """
+    return f"{kobo // 100:,}".replace(",", separator) + f".{kobo % 100:02d}"
+
+
+# Money is held as integer kobo and only rendered as a Naira string ("1020.00") in JSON
+# responses; Python dumps (e.g. the history cache) keep the kobo integer. Strict, so
+# strings like "1020.00" are rejected rather than coerced
+KoboAmount = Annotated[
+    StrictInt,
+    PlainSerializer(lambda kobo: format_naira(kobo, ""), return_type=str, when_used="json"),
+]
+
+
 # Wallet Schemas
 class DepositRequest(BaseModel):
     amount: int = Field(..., gt=0)  # Amount in kobo
@@ -63,17 +83,17 @@ class DepositResponse(BaseModel):
 class DepositStatusResponse(BaseModel):
     reference: str
     status: str
-    amount: Decimal
+    amount: KoboAmount
     message: str
 
 
 class WalletBalanceResponse(BaseModel):
-    balance: Decimal
+    balance: KoboAmount
     wallet_number: str
 
 
 class TransferRequest(BaseModel):
-    wallet_number: str = Field(..., min_length=1)
+    wallet_number: str = Field(..., pattern=r"^\d{13}$")  # Generated wallet numbers are 13 digits
     amount: int = Field(..., gt=0)  # Amount in kobo
 
 
@@ -87,7 +107,7 @@ class TransactionResponse(BaseModel):
     id: int
     reference: str
     type: str
-    amount: Decimal
+    amount: KoboAmount
     status: str
     description: Optional[str] = None
     created_at: datetime
@@ -95,6 +115,13 @@ class TransactionResponse(BaseModel):
     
     class Config:
         from_attributes = True
+    
+    @field_serializer("description", when_used="json")
+    def describe(self, description: Optional[str]) -> Optional[str]:
+        """Deposit descriptions aren't stored; they follow from the amount"""
+        if description is None and self.type == "deposit":
+            return f"Deposit of ₦{format_naira(self.amount)}"
+        return description
 
 
 # Webhook Schemas
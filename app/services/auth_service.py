@@ -4,15 +4,41 @@ Authentication service for Google OAuth and JWT
 
 import jwt
 import httpx
+import orjson
+import secrets
 from datetime import datetime, timedelta
 from typing import Optional, Dict
 from urllib.parse import urlencode
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
 from app.models import User, Wallet
 from app.schemas import JWTAuthResponse
 
 
+# Shared client for Google's OAuth and userinfo endpoints; opened and closed by the app lifespan
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def init_google_client():
+    """Open the shared Google client"""
+    global _client
+    _client = httpx.AsyncClient(
+        http2=True,
+        timeout=30.0,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    )
+
+
+async def close_google_client():
+    """Close the shared Google client"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
 def get_google_auth_url() -> str:
     """Generate Google OAuth authorization URL"""
     params = {
@@ -28,32 +54,35 @@ def get_google_auth_url() -> str:
 
 async def exchange_code_for_token(code: str) -> dict:
     """Exchange authorization code for access token"""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://oauth2.googleapis.com/token",
-            data={
-                "code": code,
-                "client_id": settings.GOOGLE_CLIENT_ID,
-                "client_secret": settings.GOOGLE_CLIENT_SECRET,
-                "redirect_uri": settings.GOOGLE_REDIRECT_URI,
-                "grant_type": "authorization_code",
-            },
-        )
-        if response.status_code != 200:
-            raise ValueError(f"Failed to exchange code for token: {response.text}")
-        return response.json()
+    response = await _client.post(
+        "https://oauth2.googleapis.com/token",
+        data={
+            "code": code,
+            "client_id": settings.GOOGLE_CLIENT_ID,
+            "client_secret": settings.GOOGLE_CLIENT_SECRET,
+            "redirect_uri": settings.GOOGLE_REDIRECT_URI,
+            "grant_type": "authorization_code",
+        },
+    )
+    if response.status_code != 200:
+        raise ValueError(f"Failed to exchange code for token: {response.text}")
+    return orjson.loads(response.content)
 
 
 async def get_google_user_info(access_token: str) -> dict:
     """Get user information from Google"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            "https://www.googleapis.com/oauth2/v2/userinfo",
-            headers={"Authorization": f"Bearer {access_token}"},
-        )
-        if response.status_code != 200:
-            raise ValueError(f"Failed to fetch user info: {response.text}")
-        return response.json()
+    response = await _client.get(
+        "https://www.googleapis.com/oauth2/v2/userinfo",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    if response.status_code != 200:
+        raise ValueError(f"Failed to fetch user info: {response.text}")
+    return orjson.loads(response.content)
+
+
+# Signing key and algorithm list built once rather than on every encode/decode
+_JWT_KEY = settings.JWT_SECRET_KEY.encode()
+_JWT_ALGORITHMS = [settings.JWT_ALGORITHM]
 
 
 def create_jwt_token(user_id: int, email: str) -> str:
@@ -65,13 +94,13 @@ def create_jwt_token(user_id: int, email: str) -> str:
         "exp": expiration,
         "iat": datetime.utcnow(),
     }
-    return jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    return jwt.encode(payload, _JWT_KEY, algorithm=settings.JWT_ALGORITHM)
 
 
 def verify_jwt_token(token: str) -> Optional[Dict]:
     """Verify and decode JWT token"""
     try:
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        payload = jwt.decode(token, _JWT_KEY, algorithms=_JWT_ALGORITHMS)
         return payload
     except jwt.ExpiredSignatureError:
         return None
@@ -79,7 +108,7 @@ def verify_jwt_token(token: str) -> Optional[Dict]:
         return None
 
 
-async def handle_google_callback(code: str, db: Session) -> JWTAuthResponse:
+async def handle_google_callback(code: str, db: AsyncSession) -> JWTAuthResponse:
     """Handle Google OAuth callback and return JWT token"""
     # Exchange code for token
     token_data = await exchange_code_for_token(code)
@@ -94,9 +123,9 @@ async def handle_google_callback(code: str, db: Session) -> JWTAuthResponse:
     picture = user_info.get("picture")
     
     # Find or create user
-    user = db.query(User).filter(User.google_id == google_id).first()
+    user = await db.scalar(select(User).where(User.google_id == google_id))
     if not user:
-        user = db.query(User).filter(User.email == email).first()
+        user = await db.scalar(select(User).where(User.email == email))
     
     if user:
         # Update existing user
@@ -113,22 +142,16 @@ async def handle_google_callback(code: str, db: Session) -> JWTAuthResponse:
             picture=picture,
         )
         db.add(user)
-        db.flush()  # Get user ID
+        await db.flush()  # Get user ID
         
         # Create wallet for new user
-        wallet_number = generate_wallet_number(db)
-        wallet = Wallet(
-            user_id=user.id,
-            wallet_number=wallet_number,
-            balance=0.00,
-        )
-        db.add(wallet)
+        await create_wallet(user.id, db)
     
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     
     # Get wallet number
-    wallet = db.query(Wallet).filter(Wallet.user_id == user.id).first()
+    wallet = await db.scalar(select(Wallet).where(Wallet.user_id == user.id))
     wallet_number = wallet.wallet_number if wallet else None
     
     # Generate JWT token
@@ -143,12 +166,32 @@ async def handle_google_callback(code: str, db: Session) -> JWTAuthResponse:
     )
 
 
-def generate_wallet_number(db: Session) -> str:
-    """Generate unique wallet number"""
-    import secrets
-    while True:
-        wallet_number = ''.join([str(secrets.randbelow(10)) for _ in range(13)])
-        existing = db.query(Wallet).filter(Wallet.wallet_number == wallet_number).first()
-        if not existing:
-            return wallet_number
+def generate_wallet_number() -> str:
+    """Generate a random 13-digit wallet number (one uniform draw, zero-padded)"""
+    return f"{secrets.randbelow(10 ** 13):013d}"
+
+
+# Attempts at drawing a free wallet number before giving up
+WALLET_NUMBER_ATTEMPTS = 3
+
+
+async def create_wallet(user_id: int, db: AsyncSession) -> Wallet:
+    """
+    Insert an empty wallet for a user, drawing a new number on collision
+    The unique wallet_number constraint is the uniqueness check; each attempt
+    runs in a savepoint so a collision doesn't roll back the new user
+    """
+    for attempt in range(WALLET_NUMBER_ATTEMPTS):
+        wallet = Wallet(
+            user_id=user_id,
+            wallet_number=generate_wallet_number(),
+            balance=0,
+        )
+        try:
+            async with db.begin_nested():
+                db.add(wallet)
+            return wallet
+        except IntegrityError:
+            if attempt == WALLET_NUMBER_ATTEMPTS - 1:
+                raise
 
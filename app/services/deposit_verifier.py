@@ -0,0 +1,180 @@
+"""
+Background verification of pending deposits with Paystack
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import func, or_, select, update
+from app.cache.redis_client import invalidate_transactions
+from app.database import AsyncSessionLocal
+from app.models import Transaction, TransactionStatus, TransactionType, WebhookEvent
+from app.services.paystack_service import verify_paystack_transaction
+from app.services.wallet_service import process_webhook_event
+
+
+logger = logging.getLogger(__name__)
+
+
+class PendingVerifier:
+    """
+    Periodically check recent pending deposits with Paystack
+    Deposits Paystack reports as failed are marked FAILED. Successful ones are
+    left to the webhook, which is the only path that credits wallets.
+    Each deposit is re-checked with a backoff of half its age (between one
+    interval and max_backoff), most overdue first.
+    Webhook inbox events that were never processed (e.g. the process exited
+    before the background credit ran) are replayed here too; an event whose
+    replay fails is retried with a doubling backoff (up to max_backoff).
+    """
+
+    def __init__(
+        self,
+        interval: float = 5.0,
+        window: timedelta = timedelta(hours=1),
+        max_backoff: timedelta = timedelta(minutes=5),
+        replay_after: timedelta = timedelta(seconds=30),
+        batch_size: int = 100,
+        max_concurrency: int = 20,
+    ):
+        self.interval = interval
+        self.window = window
+        self.max_backoff = max_backoff
+        self.replay_after = replay_after
+        self.batch_size = batch_size
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the polling loop"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the polling loop"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            # Separate steps, so a failing replay can't hold up verification (or vice versa)
+            try:
+                await self.replay_webhook_events()
+            except Exception:
+                logger.exception("Webhook event replay failed; retrying next tick")
+            try:
+                await self.verify_pending()
+            except Exception:
+                logger.exception("Pending deposit verification failed; retrying next tick")
+
+    async def replay_webhook_events(self):
+        """Process inbox events whose background credit never completed"""
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            stale = (await db.execute(
+                select(WebhookEvent.id, WebhookEvent.reference, WebhookEvent.replay_attempts).where(
+                    WebhookEvent.processed_at.is_(None),
+                    WebhookEvent.received_at < now - self.replay_after,
+                    or_(WebhookEvent.next_replay_at.is_(None), WebhookEvent.next_replay_at <= now),
+                ).order_by(
+                    func.coalesce(WebhookEvent.next_replay_at, WebhookEvent.received_at), WebhookEvent.id
+                ).limit(self.batch_size)
+            )).all()
+        # Crediting is idempotent, so replaying an event that did credit is harmless
+        for row in stale:
+            try:
+                await process_webhook_event(row.id, row.reference)
+            except Exception:
+                logger.exception("Replaying webhook event %s failed; backing off", row.id)
+                await self.defer_replay(row.id, row.replay_attempts + 1)
+
+    def next_replay_at(self, now: datetime, attempts: int) -> datetime:
+        """When to replay a failing event again: doubling from replay_after, up to max_backoff"""
+        # Exponent capped so long-failing events can't overflow timedelta
+        return now + min(self.replay_after * 2 ** min(attempts - 1, 20), self.max_backoff)
+
+    async def defer_replay(self, event_id: int, attempts: int):
+        """Record a failed replay so the event waits out its backoff instead of blocking the batch"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(WebhookEvent).where(WebhookEvent.id == event_id).values(
+                    replay_attempts=attempts,
+                    next_replay_at=self.next_replay_at(datetime.utcnow(), attempts),
+                )
+            )
+            await db.commit()
+
+    def next_check_at(self, now: datetime, created_at: datetime) -> datetime:
+        """When to check a deposit again: half its age, within [interval, max_backoff]"""
+        backoff = min(max((now - created_at) / 2, timedelta(seconds=self.interval)), self.max_backoff)
+        return now + backoff
+
+    async def verify_pending(self):
+        """Verify one batch of due pending deposits"""
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            # Most overdue first, so a large backlog is worked through instead of
+            # re-checking the same rows; rows another worker has claimed are skipped
+            due = (await db.execute(
+                select(
+                    Transaction.id, Transaction.reference, Transaction.user_id, Transaction.created_at
+                ).where(
+                    Transaction.type == TransactionType.DEPOSIT,
+                    Transaction.status == TransactionStatus.PENDING,
+                    Transaction.created_at > now - self.window,
+                    or_(Transaction.next_check_at.is_(None), Transaction.next_check_at <= now),
+                ).order_by(
+                    func.coalesce(Transaction.next_check_at, Transaction.created_at), Transaction.id
+                ).limit(self.batch_size).with_for_update(skip_locked=True)
+            )).all()
+            if not due:
+                return
+
+            # Schedule the next check before calling Paystack, so other workers
+            # (and the next tick) leave these rows alone until then
+            await db.execute(
+                update(Transaction),
+                [{"id": row.id, "next_check_at": self.next_check_at(now, row.created_at)} for row in due],
+            )
+            await db.commit()
+
+        # No session (or pooled connection) is held while waiting on Paystack
+        statuses = await asyncio.gather(*(self.fetch_status(row.reference) for row in due))
+        failed = [row for row, paystack_status in zip(due, statuses) if paystack_status == "failed"]
+        if not failed:
+            return
+
+        async with AsyncSessionLocal() as db:
+            # Only rows still pending are touched, so a webhook that landed meanwhile wins;
+            # RETURNING reports which rows actually changed in the same round trip
+            updated_user_ids = (await db.scalars(
+                update(Transaction).where(
+                    Transaction.id.in_([row.id for row in failed]),
+                    Transaction.status == TransactionStatus.PENDING,
+                ).values(
+                    status=TransactionStatus.FAILED, updated_at=datetime.utcnow()
+                ).returning(Transaction.user_id)
+            )).all()
+            await db.commit()
+        if updated_user_ids:
+            await invalidate_transactions(*set(updated_user_ids))
+
+    async def fetch_status(self, reference: str) -> Optional[str]:
+        """Get a transaction's Paystack status, or None if it can't be verified"""
+        async with self.semaphore:
+            try:
+                paystack_data = await verify_paystack_transaction(reference)
+            except Exception:
+                return None
+        return paystack_data.get("data", {}).get("status")
+
+
+pending_verifier = PendingVerifier()
@@ -3,6 +3,7 @@ Paystack payment service
 """
 
 import httpx
+import orjson
 import hmac
 import hashlib
 import secrets
@@ -10,54 +11,80 @@ from typing import Dict, Optional
 from app.config import settings
 
 
+# Webhook signing key, encoded once at import, and an HMAC with the key
+# schedule already applied; each verification works on a copy
+_WEBHOOK_KEY = settings.PAYSTACK_WEBHOOK_SECRET.encode()
+_HMAC_PROTOTYPE = hmac.new(_WEBHOOK_KEY, b"", hashlib.sha512)
+
+# A SHA-512 hex digest; anything else is rejected before hashing the payload
+_SIGNATURE_LENGTH = 128
+_HEX_SET = frozenset(b"0123456789abcdef")
+
+_CALLBACK_URL = f"{settings.BASE_URL}/wallet/paystack/callback"
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Shared client so calls reuse pooled HTTP/2 connections instead of a new TLS handshake each;
+# opened and closed by the app lifespan
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def init_paystack_client():
+    """Open the shared Paystack client"""
+    global _client
+    _client = httpx.AsyncClient(
+        base_url="https://api.paystack.co",
+        http2=True,
+        timeout=30.0,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        headers={"Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}"},
+    )
+
+
+async def close_paystack_client():
+    """Close the shared Paystack client"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
 async def initiate_paystack_payment(amount: int, email: str, reference: str) -> dict:
     """Initialize Paystack payment"""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://api.paystack.co/transaction/initialize",
-            json={
-                "amount": amount,
-                "email": email,
-                "reference": reference,
-                "callback_url": f"{settings.BASE_URL}/wallet/paystack/callback",
-            },
-            headers={
-                "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}",
-                "Content-Type": "application/json",
-            },
-            timeout=30.0,
-        )
-        if response.status_code != 200:
-            raise ValueError(f"Payment initiation failed: {response.text}")
-        return response.json()
+    response = await _client.post(
+        "/transaction/initialize",
+        content=orjson.dumps({
+            "amount": amount,
+            "email": email,
+            "reference": reference,
+            "callback_url": _CALLBACK_URL,
+        }),
+        headers=_JSON_HEADERS,
+    )
+    if response.status_code != 200:
+        raise ValueError(f"Payment initiation failed: {response.text}")
+    return orjson.loads(response.content)
 
 
 async def verify_paystack_transaction(reference: str) -> dict:
     """Verify Paystack transaction status"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"https://api.paystack.co/transaction/verify/{reference}",
-            headers={
-                "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}",
-            },
-            timeout=30.0,
-        )
-        if response.status_code != 200:
-            raise ValueError(f"Failed to verify transaction: {response.text}")
-        return response.json()
+    response = await _client.get(f"/transaction/verify/{reference}")
+    if response.status_code != 200:
+        raise ValueError(f"Failed to verify transaction: {response.text}")
+    return orjson.loads(response.content)
 
 
 def verify_paystack_webhook_signature(payload: bytes, signature: str) -> bool:
     """Verify Paystack webhook signature"""
-    if not settings.PAYSTACK_WEBHOOK_SECRET:
+    if not _WEBHOOK_KEY:
         return False  # If no secret configured, reject
     
-    computed_signature = hmac.new(
-        settings.PAYSTACK_WEBHOOK_SECRET.encode(),
-        payload,
-        hashlib.sha512
-    ).hexdigest()
-    return hmac.compare_digest(computed_signature, signature)
+    signature_bytes = signature.lower().encode()
+    if len(signature_bytes) != _SIGNATURE_LENGTH or not _HEX_SET.issuperset(signature_bytes):
+        return False
+    
+    mac = _HMAC_PROTOTYPE.copy()
+    mac.update(payload)
+    return hmac.compare_digest(mac.hexdigest().encode(), signature_bytes)
 
 
 def generate_payment_reference() -> str:
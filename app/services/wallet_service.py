@@ -2,109 +2,252 @@
 Wallet service for balance, transfers, and transactions
 """
 
-from decimal import Decimal
 from datetime import datetime
-from typing import List, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from app.models import Wallet, Transaction, User, TransactionType, TransactionStatus
+from typing import List, Optional, Tuple
+from cachetools import TTLCache
+from pydantic import TypeAdapter
+from sqlalchemy import delete, lambda_stmt, or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import Wallet, Transaction, User, TransactionType, TransactionStatus, WebhookEvent
 from app.schemas import TransactionResponse
+from app.cache.redis_client import (
+    get_cached_transactions,
+    cache_transactions,
+    invalidate_transactions,
+    get_cached_balance,
+    cache_balance,
+    invalidate_wallet_caches,
+    get_cached_settled_deposit,
+    cache_settled_deposit,
+)
+import base64
+import orjson
 import secrets
 
 
-def get_wallet_balance(user_id: int, db: Session) -> Decimal:
-    """Get wallet balance for user"""
-    wallet = db.query(Wallet).filter(Wallet.user_id == user_id).first()
-    if not wallet:
-        raise ValueError("Wallet not found")
-    return wallet.balance
+_transaction_list = TypeAdapter(List[TransactionResponse])
+
+
+# Hot-path lookups are built with lambda_stmt: the statement is constructed and its
+# cache key computed once per call site, and later calls only rebind the parameters
+
+# user_id -> (balance in kobo, wallet_number), in front of the shared Redis copy.
+# Balances may be up to a TTL stale when another process wrote; writes drop their entries
+_balance_cache = TTLCache(maxsize=10000, ttl=settings.BALANCE_CACHE_TTL)
 
 
-def create_deposit_transaction(
+async def invalidate_balance(*user_ids: int):
+    """Drop cached balances and transaction pages after the wallets change"""
+    for user_id in user_ids:
+        _balance_cache.pop(user_id, None)
+    await invalidate_wallet_caches(*user_ids)
+
+
+async def get_wallet_summary(user_id: int, db: AsyncSession) -> Tuple[int, str]:
+    """Get (balance in kobo, wallet number) for user"""
+    cached = _balance_cache.get(user_id)
+    if cached is not None:
+        return cached
+    
+    summary = await get_cached_balance(user_id)
+    if summary is None:
+        row = (await db.execute(lambda_stmt(
+            lambda: select(Wallet.balance, Wallet.wallet_number).where(Wallet.user_id == user_id)
+        ))).first()
+        if row is None:
+            raise ValueError("Wallet not found")
+        summary = (row.balance, row.wallet_number)
+        await cache_balance(user_id, *summary)
+    _balance_cache[user_id] = summary
+    return summary
+
+
+async def create_deposit_transaction(
     user_id: int,
-    amount: Decimal,
+    amount: int,
     reference: str,
-    authorization_url: str,
-    db: Session
+    authorization_url: Optional[str],
+    db: AsyncSession
 ) -> Transaction:
-    """Create a deposit transaction"""
-    wallet = db.query(Wallet).filter(Wallet.user_id == user_id).first()
-    if not wallet:
+    """
+    Create a deposit transaction (amount in kobo)
+    authorization_url may be filled in later with set_deposit_authorization_url
+    """
+    wallet_id = await db.scalar(lambda_stmt(
+        lambda: select(Wallet.id).where(Wallet.user_id == user_id)
+    ))
+    if wallet_id is None:
         raise ValueError("Wallet not found")
     
     transaction = Transaction(
         reference=reference,
         user_id=user_id,
-        wallet_id=wallet.id,
+        wallet_id=wallet_id,
         type=TransactionType.DEPOSIT,
         amount=amount,
         status=TransactionStatus.PENDING,
         authorization_url=authorization_url,
-        description=f"Deposit of ₦{amount:,.2f}",
     )
     db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
+    await db.commit()
+    await db.refresh(transaction)
+    await invalidate_transactions(user_id)
     return transaction
 
 
-def credit_wallet_from_deposit(
+async def set_deposit_authorization_url(
     reference: str,
-    db: Session
+    authorization_url: str,
+    db: AsyncSession
+):
+    """Attach the Paystack payment URL to a deposit created before it was known"""
+    await db.execute(
+        update(Transaction).where(Transaction.reference == reference).values(
+            authorization_url=authorization_url
+        )
+    )
+    await db.commit()
+
+
+async def delete_pending_deposit(user_id: int, reference: str, db: AsyncSession):
+    """Remove a deposit whose Paystack initialization didn't go through (no payment exists)"""
+    await db.execute(
+        delete(Transaction).where(
+            Transaction.reference == reference,
+            Transaction.user_id == user_id,
+            Transaction.status == TransactionStatus.PENDING,
+        )
+    )
+    await db.commit()
+    await invalidate_transactions(user_id)
+
+
+async def credit_wallet_from_deposit(
+    reference: str,
+    db: AsyncSession
 ) -> bool:
     """Credit wallet from successful deposit (called by webhook)"""
-    transaction = db.query(Transaction).filter(
-        Transaction.reference == reference
-    ).first()
-    
-    if not transaction:
-        return False
+    # Claim the deposit and read what to credit in one statement. Only a
+    # not-yet-successful deposit matches, so a repeated webhook can't credit twice
+    # (a deposit the verifier already marked FAILED can still succeed late)
+    claimed = (await db.execute(
+        update(Transaction).where(
+            Transaction.reference == reference,
+            Transaction.type == TransactionType.DEPOSIT,
+            Transaction.status != TransactionStatus.SUCCESS,
+        ).values(
+            status=TransactionStatus.SUCCESS, updated_at=datetime.utcnow()
+        ).returning(Transaction.wallet_id, Transaction.amount, Transaction.user_id)
+    )).first()
     
-    # Idempotency check - don't credit twice
-    if transaction.status == TransactionStatus.SUCCESS:
-        return True
-    
-    if transaction.type != TransactionType.DEPOSIT:
-        return False
-    
-    wallet = db.query(Wallet).filter(Wallet.id == transaction.wallet_id).first()
-    if not wallet:
-        return False
+    if claimed is None:
+        # Idempotency - already credited is a success, anything else isn't ours to credit
+        already_credited = await db.scalar(
+            select(Transaction.id).where(
+                Transaction.reference == reference,
+                Transaction.status == TransactionStatus.SUCCESS,
+            )
+        )
+        await db.rollback()
+        return already_credited is not None
     
     # Credit wallet
-    wallet.balance += transaction.amount
-    transaction.status = TransactionStatus.SUCCESS
-    transaction.updated_at = datetime.utcnow()
+    credited = await db.execute(
+        update(Wallet).where(Wallet.id == claimed.wallet_id).values(
+            balance=Wallet.balance + claimed.amount
+        )
+    )
+    if credited.rowcount == 0:
+        await db.rollback()
+        return False
     
-    db.commit()
+    await db.commit()
+    await invalidate_balance(claimed.user_id)
+    # Warm the callback page lookup; the payer is usually redirected there right away
+    await cache_settled_deposit(reference, claimed.amount)
     return True
 
 
-def transfer_funds(
+async def record_webhook_event(
+    reference: str,
+    payload_hash: bytes,
+    db: AsyncSession
+) -> Optional[int]:
+    """
+    Store a webhook in the inbox before acknowledging it
+    Returns the event id, or None if the same payload was already received
+    """
+    event = WebhookEvent(reference=reference, payload_hash=payload_hash)
+    db.add(event)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return None
+    return event.id
+
+
+async def process_webhook_event(event_id: int, reference: str):
+    """Credit the deposit for an inbox event (runs after the webhook response)"""
+    async with AsyncSessionLocal() as db:
+        await credit_wallet_from_deposit(reference, db)
+        await db.execute(
+            update(WebhookEvent).where(WebhookEvent.id == event_id).values(
+                processed_at=datetime.utcnow()
+            )
+        )
+        await db.commit()
+
+
+async def transfer_funds(
     sender_user_id: int,
     recipient_wallet_number: str,
-    amount: Decimal,
-    db: Session
+    amount: int,
+    db: AsyncSession
 ) -> Transaction:
-    """Transfer funds between wallets"""
-    # Get sender wallet
-    sender_wallet = db.query(Wallet).filter(Wallet.user_id == sender_user_id).first()
+    """Transfer funds between wallets (amount in kobo)"""
+    # Sender and recipient wallets in one round trip; balances aren't read here,
+    # the debit below checks them atomically. Both rows are locked lowest id first
+    # so opposite transfers (A->B, B->A) queue instead of deadlocking (no-op on SQLite)
+    wallets = (await db.execute(lambda_stmt(
+        lambda: select(Wallet.id, Wallet.user_id, Wallet.wallet_number).where(
+            or_(Wallet.user_id == sender_user_id, Wallet.wallet_number == recipient_wallet_number)
+        ).order_by(Wallet.id).with_for_update()
+    ))).all()
+    sender_wallet = next((w for w in wallets if w.user_id == sender_user_id), None)
+    recipient_wallet = next((w for w in wallets if w.wallet_number == recipient_wallet_number), None)
+    
+    error = None
     if not sender_wallet:
-        raise ValueError("Sender wallet not found")
+        error = "Sender wallet not found"
+    elif not recipient_wallet:
+        error = "Recipient wallet not found"
+    elif recipient_wallet.user_id == sender_user_id:
+        error = "Cannot transfer to your own wallet"
+    if error:
+        await db.rollback()  # Release the row locks
+        raise ValueError(error)
     
-    # Check balance
-    if sender_wallet.balance < amount:
+    # Debit only if the balance covers it, in the same statement, so concurrent
+    # transfers can't both pass a stale balance check
+    debited = await db.scalar(
+        update(Wallet).where(
+            Wallet.id == sender_wallet.id,
+            Wallet.balance >= amount,
+        ).values(balance=Wallet.balance - amount).returning(Wallet.balance)
+    )
+    if debited is None:
+        await db.rollback()
         raise ValueError("Insufficient balance")
     
-    # Get recipient wallet
-    recipient_wallet = db.query(Wallet).filter(
-        Wallet.wallet_number == recipient_wallet_number
-    ).first()
-    if not recipient_wallet:
-        raise ValueError("Recipient wallet not found")
-    
-    if recipient_wallet.user_id == sender_user_id:
-        raise ValueError("Cannot transfer to your own wallet")
+    await db.execute(
+        update(Wallet).where(Wallet.id == recipient_wallet.id).values(
+            balance=Wallet.balance + amount
+        )
+    )
     
     # Generate transfer reference
     reference = f"transfer_{secrets.token_hex(16)}"
@@ -120,65 +263,149 @@ def transfer_funds(
         status=TransactionStatus.SUCCESS,
         description=f"Transfer to {recipient_wallet_number}",
     )
-    db.add(transfer_transaction)
     
     # Create received transaction (recipient)
     received_transaction = Transaction(
         reference=f"{reference}_received",
         user_id=recipient_wallet.user_id,
         wallet_id=recipient_wallet.id,
+        recipient_wallet_id=None,  # Same columns as the transfer row, so both go in one INSERT
         type=TransactionType.RECEIVED,
         amount=amount,
         status=TransactionStatus.SUCCESS,
         description=f"Received from {sender_wallet.wallet_number}",
     )
-    db.add(received_transaction)
+    db.add_all([transfer_transaction, received_transaction])
     
-    # Update balances (atomic operation)
-    sender_wallet.balance -= amount
-    recipient_wallet.balance += amount
-    
-    db.commit()
-    db.refresh(transfer_transaction)
+    await db.commit()
+    await invalidate_balance(sender_user_id, recipient_wallet.user_id)
+    await db.refresh(transfer_transaction)
     return transfer_transaction
 
 
-def get_transaction_history(
+def encode_cursor(created_at: datetime, transaction_id: int) -> str:
+    """Encode a transaction's position as an opaque pagination cursor"""
+    raw = f"{created_at.isoformat()}|{transaction_id}".encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a pagination cursor into (created_at, id)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, transaction_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(transaction_id)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+async def get_transaction_cursor(
+    user_id: int,
+    transaction_id: int,
+    db: AsyncSession
+) -> Tuple[datetime, int]:
+    """Resolve one of the user's transaction ids into a (created_at, id) cursor"""
+    row = (await db.execute(
+        select(Transaction.created_at, Transaction.id).where(
+            Transaction.id == transaction_id,
+            Transaction.user_id == user_id,
+        )
+    )).first()
+    if row is None:
+        raise ValueError("Invalid before_id")
+    return row.created_at, row.id
+
+
+async def get_transaction_history(
     user_id: int,
     limit: int = 50,
     offset: int = 0,
-    db: Session = None
+    db: AsyncSession = None,
+    before: Optional[Tuple[datetime, int]] = None,
 ) -> List[TransactionResponse]:
-    """Get transaction history for user"""
-    transactions = db.query(Transaction).filter(
+    """
+    Get transaction history for user (cached briefly in Redis when configured)
+    Pages by keyset when `before` (created_at, id) is given, else by offset
+    """
+    page = f"{limit}:{encode_cursor(*before)}" if before else f"{limit}:{offset}"
+    cached = await get_cached_transactions(user_id, page)
+    if cached is not None:
+        return _transaction_list.validate_json(cached)
+    
+    # Only the response columns, with the wallet number joined onto every row
+    # (one wallet per user) instead of fetched in a second query
+    query = select(
+        Transaction.id,
+        Transaction.reference,
+        Transaction.type,
+        Transaction.amount,
+        Transaction.status,
+        Transaction.description,
+        Transaction.created_at,
+        Wallet.wallet_number,
+    ).outerjoin(
+        Wallet, Wallet.user_id == Transaction.user_id
+    ).where(
         Transaction.user_id == user_id
     ).order_by(
-        Transaction.created_at.desc()
-    ).limit(limit).offset(offset).all()
+        Transaction.created_at.desc(), Transaction.id.desc()
+    ).limit(limit)
+    if before:
+        query = query.where(tuple_(Transaction.created_at, Transaction.id) < before)
+    else:
+        query = query.offset(offset)
+    rows = (await db.execute(query)).all()
     
-    # Get user's wallet number
-    wallet = db.query(Wallet).filter(Wallet.user_id == user_id).first()
-    wallet_number = wallet.wallet_number if wallet else None
-    
-    return [
+    history = [
         TransactionResponse(
-            id=t.id,
-            reference=t.reference,
-            type=t.type.value,
-            amount=t.amount,
-            status=t.status.value,
-            description=t.description,
-            created_at=t.created_at,
-            wallet_number=wallet_number,
+            id=row.id,
+            reference=row.reference,
+            type=row.type.value,
+            amount=row.amount,
+            status=row.status.value,
+            description=row.description,
+            created_at=row.created_at,
+            wallet_number=row.wallet_number,
         )
-        for t in transactions
+        for row in rows
     ]
+    # Cached as model data (kobo amounts, no derived text), not as the rendered response
+    await cache_transactions(user_id, page, orjson.dumps(_transaction_list.dump_python(history)))
+    return history
 
 
-def get_transaction_by_reference(
+async def get_deposit_outcome(
     reference: str,
-    db: Session
+    db: AsyncSession
+) -> Optional[Tuple[TransactionStatus, int]]:
+    """
+    Get (status, amount in kobo) for a reference
+    Successful deposits are final, so only those are cached (briefly, in Redis)
+    """
+    amount = await get_cached_settled_deposit(reference)
+    if amount is not None:
+        return TransactionStatus.SUCCESS, amount
+    
+    row = (await db.execute(lambda_stmt(
+        lambda: select(Transaction.status, Transaction.amount).where(Transaction.reference == reference)
+    ))).first()
+    if row is None:
+        return None
+    if row.status == TransactionStatus.SUCCESS:
+        await cache_settled_deposit(reference, row.amount)
+    return row.status, row.amount
+
+
+async def get_transaction_by_reference_for_user(
+    reference: str,
+    user_id: int,
+    db: AsyncSession
 ) -> Optional[Transaction]:
-    """Get transaction by reference"""
-    return db.query(Transaction).filter(Transaction.reference == reference).first()
+    """Get the user's transaction by reference (None for other users' references)"""
+    return await db.scalar(lambda_stmt(
+        lambda: select(Transaction).where(
+            Transaction.reference == reference,
+            Transaction.user_id == user_id,
+        )
+    ))
 
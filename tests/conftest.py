@@ -0,0 +1,38 @@
+"""
+Shared fixtures: the app runs against a throwaway SQLite database
+"""
+
+import os
+import tempfile
+
+# Settings are read at import, so the database must be chosen before app is imported
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_dir}/test.db"
+os.environ["REDIS_URL"] = ""
+
+import pytest
+from fastapi.testclient import TestClient
+from app.database import SessionLocal
+from app.main import app
+from app.models import User, Wallet
+from app.services.auth_service import create_jwt_token
+
+
+@pytest.fixture(scope="session")
+def client():
+    """App client with the lifespan (database, shared clients) running"""
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def auth_headers(client):
+    """A fresh user with an empty wallet, authenticated by JWT"""
+    with SessionLocal() as db:
+        user = User(email=f"user{os.urandom(4).hex()}@example.com", name="Test User")
+        db.add(user)
+        db.flush()
+        db.add(Wallet(user_id=user.id, wallet_number=f"{user.id:013d}", balance=0))
+        db.commit()
+        token = create_jwt_token(user.id, user.email)
+    return {"Authorization": f"Bearer {token}"}
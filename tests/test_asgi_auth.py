@@ -0,0 +1,22 @@
+"""
+Tests for which requests the auth middleware authenticates
+"""
+
+
+def test_protected_route_requires_auth(client):
+    assert client.get("/wallet/balance").status_code == 401
+    assert client.get("/wallet/deposit/ref_x/status").status_code == 401
+
+
+def test_unrouted_requests_reach_the_router(client):
+    assert client.get("/wallet/unknown").status_code == 404
+    assert client.post("/wallet/balance").status_code == 405
+    assert client.delete("/wallet/deposit/ref_x/status").status_code == 405
+
+
+def test_public_route_skips_auth(client):
+    assert client.get("/health").status_code == 200
+
+
+def test_authenticated_request_passes(client, auth_headers):
+    assert client.get("/wallet/balance", headers=auth_headers).status_code == 200
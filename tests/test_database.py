@@ -0,0 +1,27 @@
+"""
+Tests for database URL driver mapping
+"""
+
+import pytest
+from app.database import get_async_database_url, get_sync_database_url
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("sqlite:///./wallet.db", "sqlite+aiosqlite:///./wallet.db"),
+    ("postgresql://u:p@host/db", "postgresql+asyncpg://u:p@host/db"),
+    ("postgres://u:p@host/db", "postgresql+asyncpg://u:p@host/db"),
+    ("postgresql+psycopg2://u:p@host/db", "postgresql+asyncpg://u:p@host/db"),
+    ("postgresql+asyncpg://u:p@host/db", "postgresql+asyncpg://u:p@host/db"),
+])
+def test_async_database_url(url, expected):
+    assert get_async_database_url(url).render_as_string(hide_password=False) == expected
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("sqlite:///./wallet.db", "sqlite:///./wallet.db"),
+    ("postgres://u:p@host/db", "postgresql://u:p@host/db"),
+    ("postgresql+psycopg2://u:p@host/db", "postgresql+psycopg2://u:p@host/db"),
+    ("postgresql+asyncpg://u:p@host/db", "postgresql://u:p@host/db"),
+])
+def test_sync_database_url(url, expected):
+    assert get_sync_database_url(url).render_as_string(hide_password=False) == expected
@@ -0,0 +1,49 @@
+"""
+Tests for deposit initiation
+"""
+
+from unittest.mock import AsyncMock, patch
+from sqlalchemy import select
+from app.database import SessionLocal
+from app.models import Transaction
+
+
+PAYSTACK_OK = {"data": {"authorization_url": "https://checkout.paystack.com/test"}}
+
+
+def deposit(client, headers, references, paystack=None):
+    """POST /wallet/deposit with the given reference draws and Paystack mock"""
+    paystack = paystack or AsyncMock(return_value=PAYSTACK_OK)
+    with patch("app.routes.wallet.generate_payment_reference", side_effect=references), \
+            patch("app.routes.wallet.initiate_paystack_payment", paystack):
+        response = client.post("/wallet/deposit", json={"amount": 5000}, headers=headers)
+    return response, paystack
+
+
+def test_reference_collision_retries_with_fresh_reference(client, auth_headers):
+    response, _ = deposit(client, auth_headers, ["ref_collide_once"])
+    assert response.status_code == 201
+
+    response, paystack = deposit(client, auth_headers, ["ref_collide_once", "ref_fresh"])
+    assert response.status_code == 201
+    assert response.json()["reference"] == "ref_fresh"
+    # Paystack never hears of the reference another deposit owns
+    paystack.assert_awaited_once()
+    assert paystack.await_args.args[2] == "ref_fresh"
+
+
+def test_reference_collision_twice_returns_409(client, auth_headers):
+    response, _ = deposit(client, auth_headers, ["ref_collide_always"])
+    assert response.status_code == 201
+
+    response, paystack = deposit(client, auth_headers, ["ref_collide_always", "ref_collide_always"])
+    assert response.status_code == 409
+    paystack.assert_not_awaited()
+
+
+def test_paystack_failure_leaves_no_deposit(client, auth_headers):
+    paystack = AsyncMock(side_effect=ValueError("Payment initiation failed: down"))
+    response, _ = deposit(client, auth_headers, ["ref_paystack_down"], paystack)
+    assert response.status_code == 400
+    with SessionLocal() as db:
+        assert db.scalar(select(Transaction).where(Transaction.reference == "ref_paystack_down")) is None
@@ -0,0 +1,48 @@
+"""
+Tests for the pending deposit verifier's webhook replay
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+from app.database import SessionLocal
+from app.models import WebhookEvent
+from app.services.deposit_verifier import PendingVerifier
+
+
+def test_failing_replay_is_backed_off_without_blocking_others(client):
+    with SessionLocal() as db:
+        received_at = datetime.utcnow() - timedelta(minutes=1)
+        failing = WebhookEvent(reference="ref_replay_fail", payload_hash=b"f" * 32, received_at=received_at)
+        working = WebhookEvent(reference="ref_replay_ok", payload_hash=b"o" * 32, received_at=received_at)
+        db.add_all([failing, working])
+        db.commit()
+        failing_id, working_id = failing.id, working.id
+
+    async def process(event_id, reference):
+        if event_id == failing_id:
+            raise RuntimeError("credit failed")
+
+    verifier = PendingVerifier()
+    process_mock = AsyncMock(side_effect=process)
+    with patch("app.services.deposit_verifier.process_webhook_event", process_mock):
+        client.portal.call(verifier.replay_webhook_events)
+        replayed = {call.args[0] for call in process_mock.await_args_list}
+        assert {failing_id, working_id} <= replayed
+
+        # The failed event waits out its backoff on the next pass
+        process_mock.reset_mock()
+        client.portal.call(verifier.replay_webhook_events)
+        assert failing_id not in {call.args[0] for call in process_mock.await_args_list}
+
+    with SessionLocal() as db:
+        event = db.get(WebhookEvent, failing_id)
+        assert event.replay_attempts == 1
+        assert event.next_replay_at > datetime.utcnow()
+
+
+def test_replay_backoff_doubles_up_to_max():
+    verifier = PendingVerifier(replay_after=timedelta(seconds=30), max_backoff=timedelta(minutes=5))
+    now = datetime.utcnow()
+    assert verifier.next_replay_at(now, 1) == now + timedelta(seconds=30)
+    assert verifier.next_replay_at(now, 2) == now + timedelta(seconds=60)
+    assert verifier.next_replay_at(now, 1000) == now + timedelta(minutes=5)
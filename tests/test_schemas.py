@@ -0,0 +1,41 @@
+"""
+Tests for kobo amount handling in schemas
+"""
+
+from datetime import datetime
+import orjson
+import pytest
+from pydantic import TypeAdapter, ValidationError
+from app.schemas import DepositStatusResponse, TransactionResponse, format_naira
+
+
+def test_format_naira():
+    assert format_naira(102000) == "1,020.00"
+    assert format_naira(102005, "") == "1020.05"
+    assert format_naira(7) == "0.07"
+
+
+def test_amounts_render_as_naira_in_json_only():
+    transaction = TransactionResponse(
+        id=1, reference="ref_x", type="deposit", amount=102000, status="success",
+        created_at=datetime(2026, 1, 1),
+    )
+    assert transaction.model_dump()["amount"] == 102000
+    assert transaction.model_dump()["description"] is None
+    rendered = orjson.loads(transaction.model_dump_json())
+    assert rendered["amount"] == "1020.00"
+    assert rendered["description"] == "Deposit of ₦1,020.00"
+
+
+def test_cached_history_round_trips_as_model_data():
+    adapter = TypeAdapter(list[TransactionResponse])
+    history = [TransactionResponse(
+        id=1, reference="ref_x", type="deposit", amount=5000, status="pending",
+        created_at=datetime(2026, 1, 1),
+    )]
+    assert adapter.validate_json(orjson.dumps(adapter.dump_python(history))) == history
+
+
+def test_formatted_amount_strings_are_rejected():
+    with pytest.raises(ValidationError):
+        DepositStatusResponse(reference="ref_x", status="success", amount="1020.00", message="")
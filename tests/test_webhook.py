@@ -0,0 +1,26 @@
+"""
+Tests for the Paystack webhook's header checks
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize("content_type", [
+    "application/json",
+    "Application/JSON",
+    "application/json; charset=utf-8",
+])
+def test_json_content_types_are_accepted(client, content_type):
+    # Accepted media types get as far as the signature check
+    response = client.post(
+        "/wallet/paystack/webhook", content=b"{}", headers={"Content-Type": content_type}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("content_type", ["text/plain", "application/jsonx"])
+def test_other_content_types_are_rejected(client, content_type):
+    response = client.post(
+        "/wallet/paystack/webhook", content=b"{}", headers={"Content-Type": content_type}
+    )
+    assert response.status_code == 415